@@ -22,6 +22,7 @@
 # Alex 20100606
 # eLyXer BibTeX publication entries.
 
+import unicodedata
 from elyxer.util.trace import Trace
 from elyxer.out.output import *
 from elyxer.conf.config import *
@@ -34,6 +35,9 @@ from elyxer.bib.tag import *
 class PubEntry(BibEntry):
   "A publication entry"
 
+  sortkey = None
+  sorttemplate = None
+
   def __init__(self):
     self.output = TaggedOutput().settag('p class="biblio"', True)
 
@@ -57,6 +61,21 @@ class PubEntry(BibEntry):
       return False
     return self.parser.key in BiblioReference.references
 
+  def getsortkey(self):
+    "Get the key to sort the entry, computed only once."
+    if self.sortkey == None:
+      self.sortkey = self.createsortkey()
+    return self.sortkey
+
+  def createsortkey(self):
+    "Create the sort key: the sort template from the style, collated,"
+    "or the printable representation if the style has no template."
+    if not self.sorttemplate:
+      return unicode(self)
+    text = BibPart(self.parser.tags).parse(TextPosition(self.sorttemplate)).extracttext()
+    decomposed = unicodedata.normalize('NFKD', unicode(text).lower())
+    return u''.join([char for char in decomposed if not unicodedata.combining(char)])
+
   def process(self):
     "Process the entry."
     self.index = NumberGenerator.generator.generate('pubentry')
@@ -22,7 +22,13 @@
 # Alex 20090905
 # eLyXer BibTeX processing
 
+import os
+import re
+import zlib
+import cPickle
+import traceback
 from elyxer.util.trace import Trace
+from elyxer.util.digest import *
 from elyxer.util.clone import *
 from elyxer.out.output import *
 from elyxer.io.path import *
@@ -50,13 +56,15 @@ class BibTeX(Container):
     showall = False
     if self.getparameter('btprint') == 'btPrintAll':
       showall = True
-    for file in files:
-      bibfile = BibFile(file, showall)
-      bibfile.parse()
+    bibfiles = [BibFile(file, showall) for file in files]
+    BibLoader().load(bibfiles)
+    for bibfile in bibfiles:
+      bibfile.select()
       self.entries += bibfile.entries
       Trace.message('Parsed ' + unicode(bibfile))
-    self.entries.sort(key = unicode)
-    self.applystyle()
+    style = self.readstyle()
+    self.sortentries(style)
+    self.applystyle(style)
 
   def createheader(self):
     "Create the header for the bibliography."
@@ -65,9 +73,19 @@ class BibTeX(Container):
       header.addtotoc(self)
     return header
 
-  def applystyle(self):
-    "Read the style and apply it to all entries"
-    style = self.readstyle()
+  def sortentries(self, style):
+    "Sort the entries by their sort keys, computed once per entry."
+    "With --sortbib the sort template (author, year, title) is used to"
+    "collate entries; it is taken from the style, or else from the default"
+    "style. Otherwise entries are sorted by their printable representation."
+    if Options.sortbib:
+      template = style.get('sort', BibStylesConfig.default['sort'])
+      for entry in self.entries:
+        entry.sorttemplate = template
+    self.entries.sort(key = lambda entry: entry.getsortkey())
+
+  def applystyle(self, style):
+    "Apply the style to all entries"
     for entry in self.entries:
       entry.template = style['default']
       entry.citetemplate = style['cite']
@@ -87,20 +105,34 @@ class BibTeX(Container):
 class BibFile(object):
   "A BibTeX file"
 
+  separator = re.compile(r'\s*(,\s*)?')
+  braces = re.compile(r'[{}]')
+
   def __init__(self, filename, showall):
     "Create the BibTeX file"
     self.filename = filename + '.bib'
     self.showall = showall
     self.added = 0
     self.ignored = 0
+    self.skipped = 0
     self.entries = []
+    self.parsed = []
+    self.strings = dict()
+    self.cited = None
+    if not showall:
+      self.cited = set(BiblioCite.cites.keys())
 
   def parse(self):
     "Parse the BibTeX file and extract all entries."
+    "String definitions made by the file are kept in strings."
+    before = dict(BibTag.stringdefs)
     try:
       self.parsefile()
     except IOError:
       Trace.error('Error reading ' + self.filename + '; make sure the file exists and can be read.')
+    for key, value in BibTag.stringdefs.iteritems():
+      if before.get(key) is not value:
+        self.strings[key] = value
 
   def parsefile(self):
     "Parse the whole file."
@@ -110,6 +142,9 @@ class BibFile(object):
     else:
       bulkfile = BulkFile(bibpath.path)
       text = ''.join(bulkfile.readall())
+      if self.cited != None:
+        self.parseselected(text)
+        return
       pos = TextPosition(text)
     while not pos.finished():
       pos.skipspace()
@@ -123,24 +158,231 @@ class BibFile(object):
       if entry.detect(pos):
         newentry = Cloner.clone(entry)
         newentry.parse(pos)
-        if not newentry.isvisible():
-          return
-        if self.showall or newentry.isreferenced():
-          self.entries.append(newentry)
-          self.added += 1
-        else:
-          Trace.debug('Ignored entry ' + unicode(newentry))
-          self.ignored += 1
+        if newentry.isvisible():
+          self.parsed.append(newentry)
         return
     # Skip the whole line since it's a comment outside an entry
     pos.globincluding('\n').strip()
 
+  def parseselected(self, text):
+    "Parse only string definitions and cited entries."
+    for start, end in self.prescan(text):
+      self.parseentry(TextPosition(text[start:end]))
+
+  def prescan(self, text):
+    "Find the boundaries of string definitions and cited entries."
+    "Follows the rules in parsefile(), but does not parse the entries:"
+    "an entry goes from @type{ to its matching brace, and its key is"
+    "everything before the first comma."
+    spans = []
+    position = 0
+    while position < len(text):
+      position = BibFile.separator.match(text, position).end()
+      if position >= len(text):
+        break
+      if text[position] != '@':
+        # comment or text outside an entry: skip the whole line
+        position = text.find('\n', position)
+        if position < 0:
+          break
+        position += 1
+        continue
+      opening = text.find('{', position)
+      if opening < 0:
+        opening = len(text)
+      end = self.findclosing(text, opening)
+      start = position
+      position = end
+      type = text[start:opening].lower()
+      if self.isspecial(type):
+        continue
+      if type.startswith(StringEntry.start):
+        spans.append((start, end))
+        continue
+      comma = text.find(',', opening, end)
+      if comma < 0:
+        comma = end
+      if text[opening + 1:comma].strip() in self.cited:
+        spans.append((start, end))
+      else:
+        self.skipped += 1
+    return spans
+
+  def isspecial(self, type):
+    "Find out if the type is a special entry, not shown."
+    for special in SpecialEntry.types:
+      if type.startswith(special):
+        return True
+    return False
+
+  def findclosing(self, text, opening):
+    "Find the position after the brace that closes the opening one."
+    depth = 0
+    for match in BibFile.braces.finditer(text, opening):
+      if match.group() == '{':
+        depth += 1
+      else:
+        depth -= 1
+        if depth == 0:
+          return match.end()
+    return len(text)
+
+  def select(self):
+    "Select the parsed entries to show: referenced ones, or all."
+    self.ignored = self.skipped
+    for entry in self.parsed:
+      if self.showall or entry.isreferenced():
+        self.entries.append(entry)
+        self.added += 1
+      else:
+        Trace.debug('Ignored entry ' + unicode(entry))
+        self.ignored += 1
+
   def __unicode__(self):
     "String representation"
     string = self.filename + ': ' + unicode(self.added) + ' entries added, '
     string += unicode(self.ignored) + ' entries ignored'
     return string
 
+class BibLoader(object):
+  "Loads BibTeX files in document order."
+  "Files are read from the cache (with --bibcache) when possible; the rest"
+  "are parsed in parallel processes (with --jobs) and then merged in order."
+
+  def load(self, bibfiles):
+    "Load all entries for the given files."
+    pending = []
+    for bibfile in bibfiles:
+      if len(pending) == 0 and self.loadcached(bibfile):
+        continue
+      pending.append(bibfile)
+    results = self.parseparallel(pending)
+    defined = False
+    for index, bibfile in enumerate(pending):
+      strings = self.getstringkey()
+      if defined or not index in results:
+        # string definitions in a previous file change the parse
+        bibfile.parse()
+      else:
+        bibfile.parsed, bibfile.strings, bibfile.skipped = results[index]
+        BibTag.stringdefs.update(bibfile.strings)
+      if len(bibfile.strings) > 0:
+        defined = True
+      self.store(bibfile, strings)
+
+  def parseparallel(self, bibfiles):
+    "Parse files in separate processes; return the results by index."
+    results = dict()
+    if Options.jobs <= 1 or len(bibfiles) < 2 or not hasattr(os, 'fork'):
+      return results
+    running = []
+    for index, bibfile in enumerate(bibfiles):
+      if len(running) >= Options.jobs:
+        self.collect(running.pop(0), results)
+      running.append((index, self.fork(bibfile)))
+    for worker in running:
+      self.collect(worker, results)
+    return results
+
+  def fork(self, bibfile):
+    "Parse a file in a child process that writes the result to a pipe."
+    read, write = os.pipe()
+    Trace.flush()
+    pid = os.fork()
+    if pid == 0:
+      status = 1
+      try:
+        os.close(read)
+        pipe = os.fdopen(write, 'wb')
+        try:
+          bibfile.parse()
+          result = (bibfile.parsed, bibfile.strings, bibfile.skipped)
+          pipe.write(cPickle.dumps(result, 2))
+          status = 0
+        finally:
+          pipe.close()
+      except:
+        traceback.print_exc()
+      Trace.flush()
+      os._exit(status)
+    os.close(write)
+    return (pid, read)
+
+  def collect(self, worker, results):
+    "Collect the result of a child process, if it parsed the file."
+    index, (pid, read) = worker
+    pipe = os.fdopen(read, 'rb')
+    data = pipe.read()
+    pipe.close()
+    os.waitpid(pid, 0)
+    if data == '':
+      return
+    results[index] = cPickle.loads(data)
+
+  def loadcached(self, bibfile):
+    "Load a file from the cache; return False if not cached."
+    if not Options.bibcache:
+      return False
+    key = self.getkey(bibfile, self.getstringkey())
+    filename = self.getcachename(bibfile)
+    if not key or not os.path.exists(filename):
+      return False
+    try:
+      file = open(filename, 'rb')
+      cached = cPickle.loads(zlib.decompress(file.read()))
+      cachedkey, bibfile.parsed, bibfile.strings, bibfile.skipped = cached
+      file.close()
+    except Exception:
+      Trace.error('Invalid BibTeX cache ' + filename + ', ignoring')
+      return False
+    if cachedkey != key:
+      bibfile.parsed = []
+      bibfile.strings = dict()
+      bibfile.skipped = 0
+      return False
+    BibTag.stringdefs.update(bibfile.strings)
+    return True
+
+  def store(self, bibfile, strings):
+    "Store the parsed entries of a file in the cache."
+    if not Options.bibcache:
+      return
+    key = self.getkey(bibfile, strings)
+    if not key:
+      return
+    if not os.path.exists(Options.bibcache):
+      os.makedirs(Options.bibcache)
+    cached = (key, bibfile.parsed, bibfile.strings, bibfile.skipped)
+    data = cPickle.dumps(cached, 2)
+    file = open(self.getcachename(bibfile), 'wb')
+    file.write(zlib.compress(data))
+    file.close()
+
+  def getkey(self, bibfile, strings):
+    "Get the key for a file: path, size, mtime, version, known strings"
+    "and the cited entries, if only those are parsed."
+    path = InputPath(bibfile.filename).path
+    if not os.path.exists(path):
+      return None
+    stat = os.stat(path)
+    version = GeneralConfig.version['number'] + ' ' + GeneralConfig.version['date']
+    cited = None
+    if bibfile.cited != None and not Options.lowmem:
+      cited = md5(repr(sorted(bibfile.cited))).hexdigest()
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime, version, strings, cited)
+
+  def getstringkey(self):
+    "Get a hash of the string definitions known so far."
+    strings = [(key, BibTag.stringdefs[key].extracttext())
+        for key in sorted(BibTag.stringdefs.keys())]
+    return md5(repr(strings)).hexdigest()
+
+  def getcachename(self, bibfile):
+    "Get the name of the cache file for a BibTeX file."
+    path = os.path.abspath(InputPath(bibfile.filename).path)
+    name = md5(path.encode('utf-8')).hexdigest() + '.bibcache'
+    return os.path.join(Options.bibcache, name)
+
 class BibEntry(Container):
   "An entry in a BibTeX file"
 
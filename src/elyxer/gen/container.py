@@ -169,6 +169,10 @@ class Container(object):
       return []
     return paramtext.split(',')
 
+  def isdiscarded(self):
+    "Check from the header if the contents can be discarded without parsing."
+    return False
+
   def hasemptyoutput(self):
     "Check if the parent's output is empty."
     current = self.parent
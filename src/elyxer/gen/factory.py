@@ -55,33 +55,42 @@ from elyxer.maths.misc import *
 class ContainerFactory(object):
   "Creates containers depending on the first line"
 
+  tree = None
+
   def __init__(self):
-    "Read table that convert start lines to containers"
+    "Read table that convert start lines to containers, only once"
+    if ContainerFactory.tree:
+      return
     types = dict()
     for start, typename in ContainerConfig.starts.iteritems():
       types[start] = globals()[typename]
-    self.tree = ParseTree(types)
+    ContainerFactory.tree = ParseTree(types)
 
   def createcontainer(self, reader):
     "Parse a single container."
-    #Trace.debug('processing "' + reader.currentline().strip() + '"')
-    if reader.currentline() == '':
+    line = reader.currenttokens()
+    #Trace.debug('processing "' + line.stripped + '"')
+    if line.raw == '':
       reader.nextline()
       return None
     container = Cloner.create(self.tree.find(reader))
-    container.start = reader.currentline().strip()
-    self.parse(container, reader)
+    container.start = line.stripped
+    self.parse(container, reader, line.first)
     return container
 
-  def parse(self, container, reader):
+  def parse(self, container, reader, first):
     "Parse a container"
     parser = container.parser
     parser.parent = container
-    parser.ending = self.getending(container)
+    parser.ending = self.getending(container, first)
     parser.factory = self
     container.header = parser.parseheader(reader)
     container.begin = parser.begin
-    self.parsecontents(container, reader)
+    if container.isdiscarded():
+      parser.skipnested(reader, first)
+      container.contents = []
+    else:
+      self.parsecontents(container, reader)
     container.parameters = parser.parameters
     container.parser = None
 
@@ -95,12 +104,10 @@ class ContainerFactory(object):
     else:
       container.contents = contents
 
-  def getending(self, container):
-    "Get the ending for a container"
-    split = container.start.split()
-    if len(split) == 0:
+  def getending(self, container, start):
+    "Get the ending for a container, given the first token of its start."
+    if not start:
       return None
-    start = split[0]
     if start in ContainerConfig.startendings:
       return ContainerConfig.startendings[start]
     classname = container.__class__.__name__
@@ -112,44 +119,59 @@ class ContainerFactory(object):
     return None
 
 class ParseTree(object):
-  "A parsing tree"
-
-  default = '~~default~~'
+  "A parsing tree, compiled into a flat lookup by leading tokens."
 
   def __init__(self, types):
-    "Create the parse tree"
-    self.root = dict()
+    "Create the parse tree and compile it"
+    self.starts = dict()
     for start, type in types.iteritems():
       self.addstart(type, start)
+    self.compile()
 
   def addstart(self, type, start):
-    "Add a start piece to the tree"
-    tree = self.root
-    for piece in start.split():
-      if not piece in tree:
-        tree[piece] = dict()
-      tree = tree[piece]
-    if ParseTree.default in tree:
+    "Add a start line to the tree"
+    key = tuple(start.split())
+    if key in self.starts:
       Trace.error('Start ' + start + ' duplicated')
-    tree[ParseTree.default] = type
+    self.starts[key] = type
+
+  def compile(self):
+    "Compile all prefixes of all starts into a flat lookup."
+    "Each prefix is mapped to the type of its longest defined prefix."
+    self.depth = 0
+    self.lookup = dict()
+    self.fallback = None
+    if () in self.starts:
+      self.fallback = self.starts[()]
+    for key in self.starts:
+      self.depth = max(self.depth, len(key))
+      for length in range(1, len(key) + 1):
+        self.lookup[key[:length]] = None
+    for prefix in self.lookup:
+      self.lookup[prefix] = self.getdefault(prefix)
+
+  def getdefault(self, prefix):
+    "Get the type for the longest defined start within the prefix."
+    for length in range(len(prefix), 0, -1):
+      if prefix[:length] in self.starts:
+        return self.starts[prefix[:length]]
+    return self.fallback
 
   def find(self, reader):
     "Find the current sentence in the tree"
-    branches = self.matchline(reader.currentline())
-    while not ParseTree.default in branches[-1]:
-      branches.pop()
-    last = branches[-1]
-    return last[ParseTree.default]
+    return self.matchline(reader.currenttokens())
 
   def matchline(self, line):
-    "Match a given line against the tree, as deep as possible."
-    branches = [self.root]
-    for piece in line.split(' '):
-      current = branches[-1]
-      piece = piece.rstrip('>')
-      if piece in current:
-        branches.append(current[piece])
-      else:
-        return branches
-    return branches
+    "Match a given tokenized line against the lookup, as deep as possible."
+    if line.raw[:1].isspace():
+      # indented lines are never container starts
+      return self.fallback
+    result = self.fallback
+    prefix = ()
+    for piece in line.tokens[:self.depth]:
+      prefix += (piece.rstrip('>'),)
+      if not prefix in self.lookup:
+        return result
+      result = self.lookup[prefix]
+    return result
 
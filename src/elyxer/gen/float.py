@@ -100,12 +100,10 @@ class Float(Container):
     image = images[0]
     if not image.size:
       return
-    width = image.size.removepercentwidth()
+    width = image.widen()
     if not width:
       return
-    image.type = 'figure'
     ContainerSize().setmax(width).addstyle(container)
-    image.settag()
 
   def searchinside(self, type):
     "Search for a given type in the contents"
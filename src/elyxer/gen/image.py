@@ -25,8 +25,15 @@
 import struct
 import sys
 import os
+import copy
+import base64
+import re
+import pickle
 import shutil
+import tempfile
+import subprocess
 from elyxer.util.trace import Trace
+from elyxer.util.digest import *
 from elyxer.util.translate import *
 from elyxer.gen.container import *
 from elyxer.gen.size import *
@@ -39,6 +46,13 @@ class Image(Container):
   defaultformat = ImageConfig.formats['default']
   size = None
   copy = None
+  conversion = None
+  widened = False
+  resize = None
+  sourcescale = None
+  variants = []
+  found = False
+  restored = False
 
   def __init__(self):
     self.parser = InsetParser()
@@ -47,15 +61,55 @@ class Image(Container):
 
   def process(self):
     "Place the url, convert the image if necessary."
+    "If the conversion runs in the background the size is set on output."
+    "Images unchanged since the last build are restored from the index."
     self.origin = InputPath(self.getparameter('filename'))
     self.destination = self.getdestination(self.origin)
     self.size = ContainerSize().readparameters(self)
-    if self.origin.exists():
-      ImageConverter.instance.convert(self)
+    self.sourcescale = self.size.scale
+    if ImageFile.index and ImageFile.index.restore(self):
+      self.finish()
+      return
+    self.found = self.origin.exists()
+    if self.found:
+      self.conversion = ImageConverter.instance.convert(self)
     else:
       Trace.error('Image ' + unicode(self.origin) + ' not found')
+    if not self.conversion:
+      self.finish()
+
+  def finish(self):
+    "Wait for the conversion if necessary, then set the size and the tag."
+    if self.conversion:
+      self.conversion.wait()
+      self.conversion = None
     self.setsize()
+    if self.widened:
+      self.size.removepercentwidth()
+    self.setvariants()
+    self.settag()
+    if ImageFile.index and self.found and not self.restored:
+      ImageFile.index.record(self)
+
+  def widen(self):
+    "Turn the image into a figure if it has a percent width."
+    "Returns the width, which is removed from the image itself."
+    width = self.size.getpercentwidth()
+    if not width:
+      return None
+    self.type = 'figure'
+    if self.conversion:
+      self.widened = True
+      return width
+    self.size.removepercentwidth()
     self.settag()
+    return width
+
+  def gethtml(self):
+    "Finish any pending conversion and get the HTML code."
+    if self.conversion:
+      self.finish()
+    return Container.gethtml(self)
 
   def getdestination(self, origin):
     "Convert origin path to destination path."
@@ -84,6 +138,35 @@ class Image(Container):
     width, height = ImageFile(self.destination).getdimensions()
     self.size.checkimage(width, height)
 
+  def setvariants(self):
+    "Create the scaled variants of the image requested with --srcset."
+    "Variants are converted in the background; they are not needed here."
+    if not Options.srcset or not self.found:
+      return
+    if not ImageConverter.instance.canresize():
+      return
+    if self.destination.hasext('.svg'):
+      return
+    width, height = ImageFile(self.destination).getdimensions()
+    if not width:
+      return
+    self.variants = []
+    for variantwidth in Options.srcset:
+      if variantwidth < width:
+        variant = ImageVariant(self, variantwidth)
+        ImageConverter.instance.convert(variant)
+        self.variants.append(variant)
+
+  def getsrcset(self):
+    "Get the srcset and sizes attributes for the variants of the image."
+    width, height = ImageFile(self.destination).getdimensions()
+    sources = []
+    for variant in self.variants:
+      sources.append(variant.destination.url + ' ' + unicode(variant.resize) + 'w')
+    sources.append(self.destination.url + ' ' + unicode(width) + 'w')
+    sizes = '(max-width: ' + unicode(width) + 'px) 100vw, ' + unicode(width) + 'px'
+    return ' srcset="' + ', '.join(sources) + '" sizes="' + sizes + '"'
+
   def scalevalue(self, value):
     "Scale the value according to the image scale and return it as unicode."
     scaled = value * int(self.size.scale) / 100
@@ -92,20 +175,83 @@ class Image(Container):
   def settag(self):
     "Set the output tag for the image."
     tag = 'img class="' + self.type + '"'
-    if self.origin.exists():
+    if self.found:
       url = self.destination.url
     else:
       url = self.origin.url
     alt = Translator.translate('figure') + ' ' + url
-    tag += ' src="' + url + '" alt="' + alt + '"'
+    source = url
+    datauri = None
+    if Options.inlineimagesunder and self.found:
+      datauri = ImageInliner.instance.getdatauri(self.destination)
+    if datauri:
+      source = datauri
+    tag += ' src="' + source + '" alt="' + alt + '"'
+    if len(self.variants) > 0 and not datauri:
+      tag += self.getsrcset()
+    if Options.srcset:
+      tag += ' loading="lazy" decoding="async"'
     emptytag = True
     if self.destination.hasext('.svg'):
       self.contents = [Constant(alt)]
-      tag = 'object class="' + self.type + '" data="' + url + '"'
+      tag = 'object class="' + self.type + '" data="' + source + '"'
       emptytag = False
     self.output.settag(tag, True, empty=emptytag)
     self.size.addstyle(self)
 
+class ImageInliner(object):
+  "Embeds small images in the page as data URIs."
+  "Each different content is encoded only once per build."
+
+  types = {
+      '.png':'image/png', '.jpg':'image/jpeg', '.jpeg':'image/jpeg',
+      '.gif':'image/gif', '.webp':'image/webp', '.svg':'image/svg+xml',
+      }
+  instance = None
+
+  def __init__(self):
+    self.digests = dict()
+    self.uris = dict()
+
+  def getdatauri(self, path):
+    "Get a data URI for an image below the size threshold, or None."
+    key = unicode(path)
+    if not key in self.digests:
+      self.digests[key] = self.readdigest(path)
+    digest = self.digests[key]
+    if not digest:
+      return None
+    return self.uris[digest]
+
+  def readdigest(self, path):
+    "Read a small image and encode it, keyed by a hash of its contents."
+    ext = path.getext().lower()
+    if not ext in ImageInliner.types or not path.exists():
+      return None
+    if os.path.getsize(path.path) >= Options.inlineimagesunder:
+      return None
+    file = path.open()
+    contents = file.read()
+    file.close()
+    digest = md5(contents).hexdigest()
+    if not digest in self.uris:
+      encoded = base64.b64encode(contents)
+      self.uris[digest] = 'data:' + ImageInliner.types[ext] + ';base64,' + encoded
+    return digest
+
+ImageInliner.instance = ImageInliner()
+
+class ImageVariant(object):
+  "A scaled variant of an image, converted from the same origin."
+
+  def __init__(self, image, width):
+    self.origin = image.origin
+    self.destination = copy.copy(image.destination)
+    self.destination.addsuffix('-' + unicode(width) + 'w')
+    self.size = ContainerSize()
+    self.size.scale = image.sourcescale
+    self.resize = width
+
 class ImageConverter(object):
   "A converter from elyxer.one image file to another."
 
@@ -115,48 +261,149 @@ class ImageConverter(object):
   active = True
   instance = None
 
+  def __init__(self):
+    self.running = []
+    self.batches = dict()
+    self.cache = None
+
   def convert(self, image):
-    "Convert an image to PNG"
+    "Convert an image to PNG."
+    "Returns the conversion if it is still running in the background."
     if not ImageConverter.active or Options.noconvert:
-      return
+      return None
     if image.origin.path == image.destination.path:
-      return
-    if image.destination.exists():
-      if image.origin.getmtime() <= image.destination.getmtime():
-        # file has not changed; do not convert
-        return
+      return None
+    self.waitfor(image.destination)
+    if self.isunchanged(image):
+      return None
     image.destination.createdirs()
     if Options.copyimages:
       Trace.debug('Copying ' + image.origin.path + ' to ' + image.destination.path)
       shutil.copy2(image.origin.path, image.destination.path)
+      return None
+    params = self.getparams(image)
+    converter, command = self.buildcommand(params)
+    conversion = ImageConversion(image, converter, command)
+    if Options.imagecache:
+      conversion.cachekey = self.getcachekey(image, params)
+      if self.getcache().retrieve(conversion.cachekey, image.destination):
+        return None
+    if self.isbatchable(image):
+      self.addtobatch(conversion, params)
+      return conversion
+    self.waitfree(Options.jobs - 1)
+    if not conversion.start():
+      return None
+    if Options.jobs <= 1:
+      conversion.wait()
+      return None
+    self.running.append(conversion)
+    return conversion
+
+  def isunchanged(self, image):
+    "Find out if the destination is newer than the origin."
+    "With an image cache the contents of the origin decide instead:"
+    "a changed origin may have an older modification time."
+    if not image.destination.exists():
+      return False
+    if Options.imagecache and not Options.copyimages:
+      return False
+    return image.origin.getmtime() <= image.destination.getmtime()
+
+  def waitfor(self, destination):
+    "Wait for any running or batched conversion to the given destination."
+    for conversion in self.running + self.batches.values():
+      if conversion.isfor(destination):
+        conversion.wait()
+
+  def waitfree(self, maximum):
+    "Wait until at most the given number of conversions are running."
+    self.running = [conversion for conversion in self.running
+        if not conversion.isfinished()]
+    while len(self.running) > maximum:
+      self.running[0].wait()
+      del self.running[0]
+
+  def finish(self):
+    "Start any pending batches, and wait for all conversions still running."
+    for key in self.batches.keys():
+      self.startbatch(key)
+    self.waitfree(0)
+
+  def isbatchable(self, image):
+    "Find out if an image can be converted as part of a batch."
+    "Batch converters keep the name of the file, changing its extension."
+    if not Options.batchconvert:
+      return False
+    if not Options.converter in ImageConfig.batchconverters:
+      return False
+    origin = os.path.splitext(os.path.basename(image.origin.path))[0]
+    destination = os.path.splitext(os.path.basename(image.destination.path))[0]
+    return origin == destination
+
+  def addtobatch(self, conversion, params):
+    "Add a conversion to the batch with the same parameters."
+    destination = conversion.image.destination
+    batchparams = dict(params)
+    del batchparams['input']
+    del batchparams['output']
+    batchparams['directory'] = os.path.dirname(destination.path)
+    if batchparams['directory'] == '':
+      batchparams['directory'] = '.'
+    batchparams['extension'] = destination.getext()[1:]
+    key = repr(sorted(batchparams.items()))
+    if not key in self.batches or self.batches[key].process:
+      self.batches[key] = ImageBatch(batchparams)
+    self.batches[key].add(conversion)
+    if len(self.batches[key].conversions) >= ImageBatch.maximum:
+      self.startbatch(key)
+
+  def startbatch(self, key):
+    "Start the batch conversion with the given key, as one of the jobs."
+    batch = self.batches.pop(key)
+    if batch.process:
       return
-    converter, command = self.buildcommand(image)
-    try:
-      Trace.debug(converter + ' command: "' + command + '"')
-      result = os.system(command.encode(sys.getfilesystemencoding()))
-      if result != 0:
-        Trace.error(converter + ' not installed; images will not be processed')
-        ImageConverter.active = False
-        return
-      Trace.message('Converted ' + unicode(image.origin) + ' to ' +
-          unicode(image.destination))
-    except OSError, exception:
-      Trace.error('Error while converting image ' + unicode(image.origin)
-          + ': ' + unicode(exception))
-
-  def buildcommand(self, image):
+    self.waitfree(Options.jobs - 1)
+    if batch.start():
+      self.running.append(batch)
+
+  def canresize(self):
+    "Find out if the converter command can resize images."
+    if not Options.converter in ImageConfig.converters:
+      return '$width' in Options.converter
+    return '$width' in ImageConfig.converters[Options.converter]
+
+  def getcache(self):
+    "Get the cache of converted images."
+    if not self.cache:
+      self.cache = ImageCache(Options.imagecache)
+    return self.cache
+
+  def getcachekey(self, image, params):
+    "Get the key for an image in the cache: source and conversion command."
+    "The command is built without the actual input and output paths."
+    generic = dict(params)
+    generic['input'] = 'input' + image.origin.getext()
+    generic['output'] = 'output' + image.destination.getext()
+    converter, command = self.buildcommand(generic)
+    return self.getcache().getkey(image, command)
+
+  def buildcommand(self, params):
     "Build the command to convert the image."
     if Options.converter in ImageConfig.converters:
       command = ImageConfig.converters[Options.converter]
     else:
       command = Options.converter;
-    params = self.getparams(image)
+    return Options.converter, self.fillcommand(command, params)
+
+  def fillcommand(self, command, params):
+    "Fill a converter command template with the given parameters."
     for param in params:
       command = command.replace('$' + param, unicode(params[param]))
     # remove unwanted options
     while '[' in command and ']' in command:
       command = self.removeparam(command)
-    return Options.converter, command
+    return command
 
   def removeparam(self, command):
     "Remove an unwanted param."
@@ -184,94 +431,477 @@ class ImageConverter(object):
       params['scale'] = scale
     if image.origin.getext() in self.cropboxformats:
       params['format'] = self.cropboxformats[image.origin.getext()]
+    if image.resize:
+      params['width'] = image.resize
     return params
 
 ImageConverter.instance = ImageConverter()
 
+class ImageConversion(object):
+  "The conversion of one image, run as a separate process."
+
+  notinstalled = 127
+
+  def __init__(self, image, converter, command):
+    self.image = image
+    self.converter = converter
+    self.command = command
+    self.process = None
+    self.result = None
+    self.cachekey = None
+    self.batch = None
+
+  def start(self):
+    "Start the conversion process; returns False if it could not be started."
+    Trace.debug(self.converter + ' command: "' + self.command + '"')
+    try:
+      encoded = self.command.encode(sys.getfilesystemencoding())
+      self.process = subprocess.Popen(encoded, shell=True)
+    except OSError, exception:
+      Trace.error('Error while converting ' + self.describe()
+          + ': ' + unicode(exception))
+      self.result = -1
+      return False
+    return True
+
+  def isfor(self, destination):
+    "Find out if the conversion produces the given destination."
+    return self.image.destination.path == destination.path
+
+  def describe(self):
+    "Describe what is converted."
+    return 'image ' + unicode(self.image.origin)
+
+  def isfinished(self):
+    "Find out if the conversion has finished, reporting the result."
+    if self.result == None and self.process.poll() != None:
+      self.report(self.process.returncode)
+    return self.result != None
+
+  def wait(self):
+    "Wait for the conversion to finish, and report the result."
+    if self.batch:
+      self.batch.wait()
+      return
+    if self.result == None:
+      self.report(self.process.wait())
+
+  def report(self, result):
+    "Report the result of the conversion for this image."
+    self.result = result
+    if result == ImageConversion.notinstalled:
+      if ImageConverter.active:
+        Trace.error(self.converter + ' not installed; images will not be processed')
+      ImageConverter.active = False
+    elif result != 0:
+      Trace.error('Error while converting image ' + unicode(self.image.origin)
+          + ': ' + self.converter + ' returned ' + unicode(result))
+    else:
+      Trace.message('Converted ' + unicode(self.image.origin) + ' to ' +
+          unicode(self.image.destination))
+      if self.cachekey:
+        ImageConverter.instance.getcache().store(self.cachekey, self.image.destination)
+
+class ImageBatch(ImageConversion):
+  "A group of images with the same parameters, converted in one invocation."
+  "The converter writes to a temporary directory; converted images are then"
+  "moved to their destinations, so a failed batch leaves old images alone."
+
+  maximum = 50
+
+  def __init__(self, params):
+    self.converter = Options.converter
+    self.params = params
+    self.conversions = []
+    self.command = None
+    self.process = None
+    self.result = None
+    self.batch = None
+    self.temporary = None
+
+  def add(self, conversion):
+    "Add the conversion of an image to the batch."
+    conversion.batch = self
+    self.conversions.append(conversion)
+
+  def start(self):
+    "Build the command for all images and start it."
+    inputs = ['"' + unicode(conversion.image.origin) + '"'
+        for conversion in self.conversions]
+    params = dict(self.params)
+    params['inputs'] = ' '.join(inputs)
+    self.temporary = tempfile.mkdtemp('', '.elyxer-batch-', self.params['directory'])
+    params['directory'] = self.temporary
+    template = ImageConfig.batchconverters[self.converter]
+    self.command = ImageConverter.instance.fillcommand(template, params)
+    if ImageConversion.start(self):
+      return True
+    self.report(self.result)
+    return False
+
+  def isfor(self, destination):
+    "Find out if any image in the batch produces the given destination."
+    for conversion in self.conversions:
+      if conversion.isfor(destination):
+        return True
+    return False
+
+  def describe(self):
+    "Describe what is converted."
+    return unicode(len(self.conversions)) + ' images'
+
+  def wait(self):
+    "Start the batch if necessary, and wait for it to finish."
+    if not self.process and self.result == None:
+      self.start()
+    ImageConversion.wait(self)
+
+  def report(self, result):
+    "Report the result for each image in the batch."
+    "An image is converted if the batch produced it; it is then moved over"
+    "its destination."
+    self.result = result
+    for conversion in self.conversions:
+      produced = self.getproduced(conversion)
+      if produced and os.path.exists(produced):
+        Path.replacefile(produced, conversion.image.destination.path)
+        conversion.report(0)
+      elif result == 0:
+        conversion.report(1)
+      else:
+        conversion.report(result)
+    if self.temporary:
+      shutil.rmtree(self.temporary, True)
+
+  def getproduced(self, conversion):
+    "Get the file produced by the batch for a conversion, if started."
+    if not self.temporary:
+      return None
+    name = os.path.basename(conversion.image.destination.path)
+    return os.path.join(self.temporary, name)
+
+class ImageCache(object):
+  "A cache of converted images, addressed by their contents."
+  "Each entry is keyed by a hash of the source bytes and of the conversion"
+  "command; entries are hard-linked (or copied) to each destination."
+
+  blocksize = 65536
+
+  def __init__(self, directory):
+    self.directory = directory
+
+  def getkey(self, image, command):
+    "Get the key for the source of an image and a conversion command."
+    digest = md5()
+    file = image.origin.open()
+    block = file.read(ImageCache.blocksize)
+    while len(block) > 0:
+      digest.update(block)
+      block = file.read(ImageCache.blocksize)
+    file.close()
+    digest.update(command.encode('utf-8'))
+    return digest.hexdigest() + image.destination.getext()
+
+  def retrieve(self, key, destination):
+    "Place the cached image at the destination, if present."
+    "The destination is only replaced on a hit; on a miss it is kept, but"
+    "separated from any cached entry so that converting it does not"
+    "overwrite the entry."
+    cached = os.path.join(self.directory, key)
+    if not os.path.exists(cached):
+      self.separate(destination)
+      return False
+    Trace.debug('Using cached image ' + cached + ' for ' + unicode(destination))
+    if destination.exists() and self.issame(cached, destination.path):
+      return True
+    temporary = self.gettemporary(destination)
+    self.link(cached, temporary)
+    Path.replacefile(temporary, destination.path)
+    return True
+
+  def separate(self, destination):
+    "Give the destination its own copy if it is linked to another file."
+    if not destination.exists():
+      return
+    if os.stat(destination.path).st_nlink <= 1:
+      return
+    temporary = self.gettemporary(destination)
+    shutil.copy2(destination.path, temporary)
+    Path.replacefile(temporary, destination.path)
+
+  def issame(self, first, second):
+    "Find out if two paths are the same file (not checked on Windows)."
+    if os.name == 'nt':
+      return False
+    return os.path.samefile(first, second)
+
+  def gettemporary(self, destination):
+    "Get a free temporary name next to the destination."
+    temporary = destination.path + '.tmp'
+    if os.path.exists(temporary):
+      os.remove(temporary)
+    return temporary
+
+  def store(self, key, destination):
+    "Store a converted image in the cache."
+    if not os.path.exists(self.directory):
+      os.makedirs(self.directory)
+    cached = os.path.join(self.directory, key)
+    if not os.path.exists(cached):
+      self.link(destination.path, cached)
+
+  def link(self, source, target):
+    "Hard-link the source to the target, or copy it if links fail."
+    try:
+      os.link(source, target)
+    except (OSError, AttributeError):
+      shutil.copy2(source, target)
+
 class ImageFile(object):
-  "A file corresponding to an image (JPG or PNG)"
+  "A file corresponding to an image (PNG, JPG, GIF, WebP or SVG)"
 
   dimensions = dict()
+  index = None
+  headersize = 65536
+  svgunits = ['', 'px']
 
   def __init__(self, path):
     "Create the file based on its path"
     self.path = path
 
   def getdimensions(self):
-    "Get the dimensions of a JPG or PNG image"
-    if not self.path.exists():
-      return None, None
+    "Get the dimensions of an image, from the index if possible"
     if unicode(self.path) in ImageFile.dimensions:
       return ImageFile.dimensions[unicode(self.path)]
-    dimensions = (None, None)
-    if self.path.hasext('.png'):
-      dimensions = self.getpngdimensions()
-    elif self.path.hasext('.jpg'):
-      dimensions = self.getjpgdimensions()
-    elif self.path.hasext('.svg'):
-      dimensions = self.getsvgdimensions()
+    if not self.path.exists():
+      return None, None
+    dimensions = None
+    if ImageFile.index:
+      dimensions = ImageFile.index.get(self.path)
+    if not dimensions:
+      dimensions = self.readdimensions()
+      if ImageFile.index:
+        ImageFile.index.set(self.path, dimensions)
     ImageFile.dimensions[unicode(self.path)] = dimensions
     return dimensions
 
-  def getpngdimensions(self):
+  def readdimensions(self):
+    "Read the dimensions from the header of the image"
+    readers = {
+        '.png':self.getpngdimensions, '.jpg':self.getjpgdimensions,
+        '.jpeg':self.getjpgdimensions, '.gif':self.getgifdimensions,
+        '.webp':self.getwebpdimensions, '.svg':self.getsvgdimensions,
+        }
+    ext = self.path.getext().lower()
+    if not ext in readers:
+      return (None, None)
+    file = self.path.open()
+    header = file.read(ImageFile.headersize)
+    dimensions = readers[ext](header, file)
+    file.close()
+    return dimensions
+
+  def getpngdimensions(self, header, file):
     "Get the dimensions of a PNG image"
-    pngfile = self.path.open()
-    pngfile.seek(16)
-    width = self.readlong(pngfile)
-    height = self.readlong(pngfile)
-    pngfile.close()
+    width = self.readvalue(header, '>L', 16)
+    height = self.readvalue(header, '>L', 20)
     return (width, height)
 
-  def getjpgdimensions(self):
+  def getjpgdimensions(self, header, file):
     "Get the dimensions of a JPEG image"
-    jpgfile = self.path.open()
-    start = self.readword(jpgfile)
-    if start != int('ffd8', 16):
+    "Segments are skipped until a start of frame is found;"
+    "the file is read further only if the header is not enough."
+    if self.readvalue(header, '>H', 0) != int('ffd8', 16):
       Trace.error(unicode(self.path) + ' not a JPEG file')
       return (None, None)
-    self.skipheaders(jpgfile, ['ffc0', 'ffc2'])
-    self.seek(jpgfile, 3)
-    height = self.readword(jpgfile)
-    width = self.readword(jpgfile)
-    jpgfile.close()
+    frames = [int('ffc0', 16), int('ffc2', 16)]
+    position = 2
+    while True:
+      while position + 9 > len(header):
+        more = file.read(ImageFile.headersize)
+        if more == '':
+          Trace.error('End of file ' + unicode(self.path))
+          return (None, None)
+        header += more
+      marker = self.readvalue(header, '>H', position)
+      if marker in frames:
+        height = self.readvalue(header, '>H', position + 5)
+        width = self.readvalue(header, '>H', position + 7)
+        return (width, height)
+      length = self.readvalue(header, '>H', position + 2)
+      if length == 0:
+        Trace.error('End of file ' + unicode(self.path))
+        return (None, None)
+      position += 2 + length
+
+  def getgifdimensions(self, header, file):
+    "Get the dimensions of a GIF image"
+    width = self.readvalue(header, '<H', 6)
+    height = self.readvalue(header, '<H', 8)
     return (width, height)
 
-  def getsvgdimensions(self):
-    "Get the dimensions of a SVG image."
+  def getwebpdimensions(self, header, file):
+    "Get the dimensions of a WebP image: lossy, lossless or extended"
+    if header[0:4] != 'RIFF' or header[8:12] != 'WEBP':
+      Trace.error(unicode(self.path) + ' not a WebP file')
+      return (None, None)
+    chunk = header[12:16]
+    if chunk == 'VP8 ':
+      width = self.readvalue(header, '<H', 26) & int('3fff', 16)
+      height = self.readvalue(header, '<H', 28) & int('3fff', 16)
+      return (width, height)
+    if chunk == 'VP8L':
+      bits = self.readvalue(header, '<L', 21)
+      width = (bits & int('3fff', 16)) + 1
+      height = ((bits >> 14) & int('3fff', 16)) + 1
+      return (width, height)
+    if chunk == 'VP8X':
+      width = (self.readvalue(header, '<L', 24) & int('ffffff', 16)) + 1
+      height = (self.readvalue(header, '<L', 27) & int('ffffff', 16)) + 1
+      return (width, height)
+    Trace.error('Unknown WebP format in ' + unicode(self.path))
     return (None, None)
 
-  def skipheaders(self, file, hexvalues):
-    "Skip JPEG headers until one of the parameter headers is found"
-    headervalues = [int(value, 16) for value in hexvalues]
-    header = self.readword(file)
-    safetycounter = 0
-    while header not in headervalues and safetycounter < 30:
-      length = self.readword(file)
-      if length == 0:
-        Trace.error('End of file ' + file.name)
-        return
-      self.seek(file, length - 2)
-      header = self.readword(file)
-      safetycounter += 1
-
-  def readlong(self, file):
-    "Read a long (32-bit) value from elyxer.file"
-    return self.readformat(file, '>L', 4)
-
-  def readword(self, file):
-    "Read a 16-bit value from elyxer.file"
-    return self.readformat(file, '>H', 2)
-
-  def readformat(self, file, format, bytes):
-    "Read any format from elyxer.file"
-    read = file.read(bytes)
-    if read == '' or len(read) < bytes:
-      Trace.error('EOF reached')
+  def getsvgdimensions(self, header, file):
+    "Get the dimensions of a SVG image from its root element."
+    "Width and height must be plain numbers or pixels; otherwise"
+    "the view box is used."
+    match = re.search(r'<svg\b[^>]*>', header)
+    if not match:
+      return (None, None)
+    root = match.group(0)
+    width = self.getsvglength(root, 'width')
+    height = self.getsvglength(root, 'height')
+    if width and height:
+      return (width, height)
+    viewbox = re.search(r'\sviewBox\s*=\s*["\']([^"\']*)["\']', root)
+    if not viewbox:
+      return (None, None)
+    values = viewbox.group(1).replace(',', ' ').split()
+    if len(values) != 4:
+      return (None, None)
+    try:
+      return (int(float(values[2])), int(float(values[3])))
+    except ValueError:
+      return (None, None)
+
+  def getsvglength(self, root, attribute):
+    "Get a length in pixels from an attribute of the SVG root element."
+    expression = r'\s' + attribute + r'\s*=\s*["\']\s*([0-9.]+)\s*([a-z%]*)\s*["\']'
+    match = re.search(expression, root)
+    if not match or not match.group(2) in ImageFile.svgunits:
+      return None
+    try:
+      return int(float(match.group(1)))
+    except ValueError:
+      return None
+
+  def readvalue(self, header, format, position):
+    "Read a value in the given format from the header"
+    size = struct.calcsize(format)
+    if len(header) < position + size:
+      Trace.error('EOF reached in ' + unicode(self.path))
       return 0
-    tuple = struct.unpack(format, read)
-    return tuple[0]
+    return struct.unpack(format, header[position:position + size])[0]
+
+class ImageIndex(object):
+  "A persistent index of image dimensions, stored next to the output."
+  "Entries are keyed by path and are valid while size and mtime match."
+  "It also works as a manifest of the images in the last build: an image"
+  "whose origin has not changed and whose destination is still present"
+  "is neither checked nor converted again."
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.entries = dict()
+    self.images = dict()
+    self.listings = dict()
+    self.changed = False
+    if not os.path.exists(filename):
+      return
+    try:
+      file = open(filename, 'rb')
+      signature, self.entries, self.images = pickle.load(file)
+      file.close()
+    except Exception:
+      Trace.error('Invalid image index ' + filename + ', ignoring')
+      self.entries = dict()
+      self.images = dict()
+      return
+    if signature != self.getsignature():
+      self.images = dict()
+
+  def get(self, path):
+    "Get the dimensions for an image, or None if not indexed or changed."
+    key = unicode(path)
+    if not key in self.entries:
+      return None
+    size, mtime, dimensions = self.entries[key]
+    if (size, mtime) != self.getstamp(path):
+      return None
+    return dimensions
 
-  def seek(self, file, bytes):
-    "Seek forward, just by reading the given number of bytes"
-    file.read(bytes)
+  def set(self, path, dimensions):
+    "Set the dimensions for an image."
+    size, mtime = self.getstamp(path)
+    self.entries[unicode(path)] = (size, mtime, dimensions)
+    self.changed = True
+
+  def restore(self, image):
+    "Restore an image from the manifest if it is still valid."
+    "Costs one stat of the origin; destination directories are listed once."
+    key = image.origin.path
+    if not key in self.images:
+      return False
+    stamp, destination, dimensions = self.images[key]
+    if destination != image.destination.path:
+      return False
+    try:
+      if stamp != self.getstamp(image.origin):
+        return False
+    except OSError:
+      return False
+    if not self.islisted(destination):
+      return False
+    image.found = True
+    image.restored = True
+    ImageFile.dimensions[destination] = dimensions
+    return True
+
+  def record(self, image):
+    "Record an image in the manifest, once its destination exists."
+    dimensions = ImageFile(image.destination).getdimensions()
+    if not image.destination.exists():
+      return
+    stamp = self.getstamp(image.origin)
+    self.images[image.origin.path] = (stamp, image.destination.path, dimensions)
+    self.changed = True
+
+  def islisted(self, path):
+    "Find out if a file is present, listing each directory only once."
+    directory, name = os.path.split(path)
+    if not directory in self.listings:
+      try:
+        self.listings[directory] = set(os.listdir(directory or '.'))
+      except OSError:
+        self.listings[directory] = set()
+    return name in self.listings[directory]
+
+  def getstamp(self, path):
+    "Get the size and modification time of a file."
+    stat = os.stat(path.path)
+    return (stat.st_size, stat.st_mtime)
+
+  def getsignature(self):
+    "Get the options that decide how images are converted."
+    return repr((Options.directory, Options.destdirectory, Options.imageformat,
+      Options.noconvert, Options.copyimages, Options.converter))
+
+  def save(self):
+    "Save the index if any entry has changed."
+    if not self.changed:
+      return
+    file = open(self.filename, 'wb')
+    pickle.dump((self.getsignature(), self.entries, self.images), file, 2)
+    file.close()
 
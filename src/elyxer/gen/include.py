@@ -27,6 +27,7 @@ from elyxer.parse.parser import *
 from elyxer.parse.headerparse import *
 from elyxer.out.output import *
 from elyxer.io.bulk import *
+from elyxer.io.path import *
 from elyxer.gen.container import *
 from elyxer.gen.styles import *
 from elyxer.gen.layout import *
@@ -46,7 +47,7 @@ class IncludeInset(Container):
 
   def process(self):
     "Include the provided child document"
-    self.filename = os.path.join(Options.directory, self.getparameter('filename'))
+    self.filename = InputPath(self.getparameter('filename')).path
     Trace.debug('Child document: ' + self.filename)
     LstParser().parsecontainer(self)
     command = self.getparameter('LatexCommand')
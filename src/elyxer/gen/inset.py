@@ -82,6 +82,13 @@ class Branch(Container):
       Trace.debug('Branch ' + self.branch + ' not active')
       self.output = EmptyOutput()
 
+  def isdiscarded(self):
+    "Unselected branches are discarded without parsing."
+    branch = self.header[2]
+    if not branch in Options.branches:
+      return False
+    return not Options.branches[branch].isselected()
+
   def isactive(self):
     "Check if the branch is active"
     if not self.branch in Options.branches:
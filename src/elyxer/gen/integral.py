@@ -56,13 +56,28 @@ class IntegralTOC(IntegralProcessor):
   processedtype = TableOfContents
   tocentries = []
 
-  def processeach(self, toc):
-    "Fill in a Table of Contents."
+  def process(self):
+    "Fill in all Tables of Contents with the same entries."
+    if len(self.storage) == 0:
+      return
+    self.fragment = self.createfragment()
+    IntegralProcessor.process(self)
+
+  def createfragment(self):
+    "Create the TOC entries for the whole document, only once."
+    fragment = TOCFragment()
     converter = TOCConverter()
     for container in PartKeyGenerator.partkeyed:
-      toc.add(converter.convertindented(container))
+      entry = converter.convertindented(container)
+      if entry:
+        fragment.contents.append(entry)
     # finish off with the footer to align indents
-    toc.add(converter.convertindented(LyXFooter()))
+    fragment.contents.append(converter.convertindented(LyXFooter()))
+    return fragment
+
+  def processeach(self, toc):
+    "Fill in a Table of Contents."
+    toc.add(self.fragment)
 
   def writetotoc(self, entries, toc):
     "Write some entries to the TOC."
@@ -74,51 +89,67 @@ class IntegralBiblioEntry(IntegralProcessor):
 
   processedtype = BiblioEntry
 
+  def __init__(self):
+    IntegralProcessor.__init__(self)
+    self.entries = dict()
+
   def processeach(self, entry):
     "Process each entry."
     number = NumberGenerator.generator.generate('integralbib')
     link = Link().complete('cite', 'biblio-' + number, type='biblioentry')
     link.contents = entry.citeref
     entry.contents = [Constant('['), link, Constant('] ')]
+    self.entries[entry.key] = (entry, number, link)
     if entry.key in BiblioCite.cites:
       for cite in BiblioCite.cites[entry.key]:
-        cite.contents = entry.citeref
-        cite.anchor = 'cite-' + number
-        cite.destination = link
+        self.processcite(cite)
+
+  def processcite(self, cite):
+    "Point a cite to its processed entry."
+    entry, number, link = self.entries[cite.key]
+    cite.contents = entry.citeref
+    cite.anchor = 'cite-' + number
+    cite.destination = link
 
 class IntegralFloat(IntegralProcessor):
-  "Store all floats in the document by type."
+  "Store the entries for all floats in the document by type."
+  "Only the entry for the list of floats is kept, not the float itself."
 
   processedtype = Float
   bytype = dict()
 
   def processeach(self, float):
-    "Store each float by type."
+    "Store an entry for each float by type."
     if not float.type in IntegralFloat.bytype:
       IntegralFloat.bytype[float.type] = []
-    IntegralFloat.bytype[float.type].append(float)
+    if not float.isparent():
+      return
+    IntegralFloat.bytype[float.type].append(TOCEntry().create(float))
 
 class IntegralListOf(IntegralProcessor):
   "A processor for an integral list of floats."
 
   processedtype = ListOf
 
+  def __init__(self):
+    IntegralProcessor.__init__(self)
+    self.fragments = dict()
+
   def processeach(self, listof):
     "Fill in a list of floats."
     listof.output = TaggedOutput().settag('div class="fulltoc"', True)
     if not listof.type in IntegralFloat.bytype:
       Trace.message('No floats of type ' + listof.type)
       return
-    for float in IntegralFloat.bytype[listof.type]:
-      entry = self.processfloat(float)
-      if entry:
-        listof.contents.append(entry)
-
-  def processfloat(self, float):
-    "Get an entry for the list of floats."
-    if not float.isparent():
-      return None
-    return TOCEntry().create(float)
+    listof.contents.append(self.getfragment(listof.type))
+
+  def getfragment(self, type):
+    "Get the entries for all floats of a type, shared by all lists."
+    if not type in self.fragments:
+      fragment = TOCFragment()
+      fragment.contents = IntegralFloat.bytype[type]
+      self.fragments[type] = fragment
+    return self.fragments[type]
 
 class IntegralReference(IntegralProcessor):
   "A processor for a reference to a label."
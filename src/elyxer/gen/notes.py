@@ -134,6 +134,10 @@ class Note(Container):
     self.parser = InsetParser()
     self.output = EmptyOutput()
 
+  def isdiscarded(self):
+    "Notes and comments produce no output, so they are not even parsed."
+    return TagConfig.notes.get(self.header[2]) == ''
+
   def process(self):
     "Hide note and comment, dim greyed out"
     self.type = self.header[2]
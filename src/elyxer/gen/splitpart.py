@@ -24,9 +24,14 @@
 # http://www.nongnu.org/elyxer/
 
 
+import os
+import pickle
+import traceback
 from elyxer.util.translate import *
+from elyxer.util.digest import *
 from elyxer.gen.basket import *
 from elyxer.gen.integral import *
+from elyxer.out.search import *
 
 
 class SplitPartLink(IntegralProcessor):
@@ -179,9 +184,56 @@ class SplitPartNavigation(object):
     else:
       return container.partkey.level + 1
 
+class SplitPageManifest(object):
+  "A manifest of the split pages in the last build, stored next to the output."
+  "Each page is kept with a hash of its HTML, leaving out volatile variables"
+  "such as the date; a page with the same hash is not written again."
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.digests = dict()
+    self.written = dict()
+    self.changed = 0
+    self.unchanged = 0
+    if not os.path.exists(filename):
+      return
+    try:
+      file = open(filename, 'rb')
+      self.digests = pickle.load(file)
+      file.close()
+    except Exception:
+      Trace.error('Invalid page manifest ' + filename + ', ignoring')
+      self.digests = dict()
+
+  def isunchanged(self, page, digest):
+    "Find out if a page is the same as in the last build, and still there."
+    if self.digests.get(page) != digest:
+      return False
+    return os.path.exists(page)
+
+  def record(self, page, digest, changed):
+    "Record the hash of a page, and whether it was written."
+    self.written[page] = digest
+    if changed:
+      self.changed += 1
+    else:
+      self.unchanged += 1
+
+  def save(self):
+    "Save the manifest and report the pages written."
+    Trace.message('Split pages: ' + unicode(self.changed) + ' written, '
+        + unicode(self.unchanged) + ' unchanged')
+    file = open(self.filename, 'wb')
+    pickle.dump(self.written, file, 2)
+    file.close()
+
 class SplitFileBasket(MemoryBasket):
   "A memory basket which contains a part split into a file, possibly with a TOC."
 
+  manifest = None
+  digest = None
+  changed = True
+
   def __init__(self):
     MemoryBasket.__init__(self)
     self.entrycount = 0
@@ -209,20 +261,45 @@ class SplitFileBasket(MemoryBasket):
       return
     text = Translator.translate('toc-for') + self.root.partkey.tocentry
     toc = TableOfContents().create(text)
-    self.addbranches(self.root, toc)
+    for branch in TOCConverter.tree.getbranches(self.root):
+      toc.add(self.converter.indent(branch))
     toc.add(self.converter.convertindented(LyXFooter()))
     self.write(toc)
 
-  def addbranches(self, entry, toc):
-    "Add an entry and all of its branches to the table of contents."
-    for branch in entry.branches:
-      toc.add(self.converter.indent(branch))
-      self.addbranches(branch, toc)
-  
+  def flush(self):
+    "Flush the contents to the writer; with a manifest, only if changed."
+    if not self.manifest:
+      MemoryBasket.flush(self)
+      return
+    html = []
+    for container in self.contents:
+      html += container.gethtml()
+    digest = md5()
+    for string in html:
+      digest.update(string.encode('utf-8'))
+    self.digest = digest.hexdigest()
+    self.changed = not self.manifest.isunchanged(self.page, self.digest)
+    if self.changed:
+      self.replace(html)
+
+  def replace(self, html):
+    "Write the page to a temporary file and rename it over the old page."
+    varmap = VariableMap()
+    temporary = self.page + '.tmp'
+    writer = LineWriter(temporary)
+    for string in html:
+      if '<!--$' in string:
+        string = varmap.replacevolatile(string)
+      writer.writestring(string)
+    writer.close()
+    Path.replacefile(temporary, self.page)
+
 class SplitPartBasket(Basket):
   "A basket used to split the output in different files."
 
   baskets = []
+  manifest = None
+  search = None
 
   def setwriter(self, writer):
     if not hasattr(writer, 'filename') or not writer.filename:
@@ -234,6 +311,12 @@ class SplitPartBasket(Basket):
     self.converter = TOCConverter()
     self.basket = MemoryBasket()
     self.basket.page = writer.filename
+    if Options.incremental and not Options.tocfor:
+      self.manifest = SplitPageManifest(self.filename + '.pages')
+      VariableMap.deferred = True
+    if Options.searchindex and not Options.tocfor:
+      base, extension = os.path.splitext(self.filename)
+      self.search = SearchIndex(base + '-search.js')
     return self
 
   def write(self, container):
@@ -254,6 +337,8 @@ class SplitPartBasket(Basket):
         basket = self.addbasket(filename)
         navigation.writeheader(basket, container)
       basket.write(container)
+      if self.search:
+        self.search.add(container, basket.page)
       if self.afterheader(container):
         navigation.writefirstheader(basket)
         self.mainanchor = navigation.upanchors[0]
@@ -263,8 +348,83 @@ class SplitPartBasket(Basket):
   def finish(self):
     "Process the whole basket, split into page baskets and flush all of them."
     self.splitbaskets()
+    self.flushbaskets()
+    if self.search:
+      self.search.finish()
+    if not self.manifest:
+      return
     for basket in self.baskets:
+      self.manifest.record(basket.page, basket.digest, basket.changed)
+    self.manifest.save()
+
+  def flushbaskets(self):
+    "Flush all page baskets, in parallel processes if there are several jobs."
+    "Each process renders and writes its share of the pages; the first"
+    "share, with the main page, is written by this process."
+    workers = min(Options.jobs, len(self.baskets))
+    if workers <= 1 or not hasattr(os, 'fork'):
+      for basket in self.baskets:
+        basket.flush()
+      return
+    self.finishimages()
+    shares = [self.baskets[index::workers] for index in range(workers)]
+    running = [(share, self.forkflush(share)) for share in shares[1:]]
+    for basket in shares[0]:
       basket.flush()
+    for share, worker in running:
+      if not self.collect(share, worker):
+        Trace.error('Writing split pages in parallel failed, writing them again')
+        for basket in share:
+          basket.flush()
+
+  def forkflush(self, share):
+    "Flush a share of the baskets in a child process."
+    "The child sends back the hash of each page, and whether it was written."
+    read, write = os.pipe()
+    Trace.flush()
+    pid = os.fork()
+    if pid == 0:
+      status = 1
+      try:
+        os.close(read)
+        pipe = os.fdopen(write, 'wb')
+        try:
+          for basket in share:
+            basket.flush()
+          results = [(basket.digest, basket.changed) for basket in share]
+          pipe.write(pickle.dumps(results, 2))
+          status = 0
+        finally:
+          pipe.close()
+      except:
+        traceback.print_exc()
+      Trace.flush()
+      os._exit(status)
+    os.close(write)
+    return (pid, read)
+
+  def collect(self, share, worker):
+    "Collect the results of a child process; return False if it failed."
+    pid, read = worker
+    pipe = os.fdopen(read, 'rb')
+    data = pipe.read()
+    pipe.close()
+    pid, status = os.waitpid(pid, 0)
+    if status != 0 or data == '':
+      return False
+    for basket, (digest, changed) in zip(share, pickle.loads(data)):
+      basket.digest = digest
+      basket.changed = changed
+    return True
+
+  def finishimages(self):
+    "Finish pending image conversions before the pages are rendered apart,"
+    "so that the image index records all of them."
+    for basket in self.baskets:
+      for container in basket.contents:
+        for image in container.searchall(Image):
+          if image.conversion:
+            image.finish()
 
   def afterheader(self, container):
     "Find out if this is the header on the file."
@@ -280,6 +440,7 @@ class SplitPartBasket(Basket):
       writer = LineWriter(filename)
     basket = SplitFileBasket()
     basket.setwriter(writer)
+    basket.manifest = self.manifest
     self.baskets.append(basket)
     # set the page name everywhere
     basket.page = filename
@@ -305,6 +466,165 @@ class SplitPartBasket(Basket):
     base, extension = os.path.splitext(basename)
     return base + '-' + partname + extension
 
+class SplitStreamBasket(SplitPartBasket):
+  "A basket that splits the output into pages as it goes, to conserve memory."
+  "A page is closed when the next page starts, and written as soon as all"
+  "it refers to is known: the pages its links point to and, with a full TOC,"
+  "its own sub-TOC. Pages with a full TOC or a list of floats wait until the"
+  "end. Only pages still waiting are kept in memory."
+
+  def setwriter(self, writer):
+    "Set the writer and prepare the first page."
+    SplitPartBasket.setwriter(self, writer)
+    self.basket = None
+    self.baskets = []
+    self.closed = []
+    self.navigation = SplitPartNavigation()
+    self.bibliography = IntegralBiblioEntry()
+    self.floats = IntegralFloat()
+    self.toc = IntegralTOC()
+    self.listof = IntegralListOf()
+    self.fulltoc = False
+    self.partkeyed = 0
+    self.unconverted = set()
+    self.current = self.firstbasket()
+    return self
+
+  def write(self, container):
+    "Write a container to the current page, or to a new page."
+    if self.mustsplit(container):
+      self.closepage()
+      filename = self.getfilename(container)
+      Trace.debug('New page ' + filename)
+      self.current = self.addbasket(filename)
+      self.navigation.writeheader(self.current, container)
+      self.setpages(self.current)
+      self.flushready()
+    self.current.write(container)
+    self.integrate(container)
+    if self.search:
+      self.search.add(container, self.current.page)
+    if self.afterheader(container):
+      self.navigation.writefirstheader(self.current)
+      self.mainanchor = self.navigation.upanchors[0]
+    self.setpages(self.current)
+
+  def finish(self):
+    "Fill in the full TOC and lists of floats, and write all remaining pages."
+    self.closed.append(self.current)
+    self.toc.process()
+    self.listof.process()
+    for page in list(self.closed):
+      self.flushpage(page)
+    if self.search:
+      self.search.finish()
+    if self.manifest:
+      self.manifest.save()
+
+  def addbasket(self, filename, writer = None):
+    "Add a new page, keeping track of what it refers to."
+    page = SplitPartBasket.addbasket(self, filename, writer)
+    page.references = []
+    page.links = []
+    page.waiting = False
+    page.deferredtoc = False
+    page.closing = []
+    page.linked = 0
+    return page
+
+  def closepage(self):
+    "Close the current page; its navigation is complete when the next starts."
+    page = self.current
+    if not self.fulltoc:
+      page.addtoc()
+    else:
+      page.deferredtoc = True
+    if self.navigation.lastnavigation:
+      page.closing.append(self.navigation.lastnavigation)
+    page.closing.append(LyXFooter())
+    self.closed.append(page)
+
+  def flushready(self):
+    "Write all closed pages that do not depend on later contents."
+    for page in list(self.closed):
+      if self.isready(page):
+        self.flushpage(page)
+
+  def isready(self, page):
+    "Find out if everything a closed page refers to is known."
+    if page.waiting:
+      return False
+    for link in page.links:
+      if not link.destination.page:
+        return False
+    if page.deferredtoc and page.entrycount == 1 and not TOCConverter.tree.isclosed(page.root):
+      return False
+    return True
+
+  def flushpage(self, page):
+    "Complete a page, write it and forget it."
+    for reference in page.references:
+      reference.formatcontents()
+    if page.deferredtoc:
+      page.addtoc()
+    for container in page.closing:
+      page.write(container)
+    self.setpages(page)
+    page.flush()
+    if self.manifest:
+      self.manifest.record(page.page, page.digest, page.changed)
+    self.closed.remove(page)
+    self.baskets.remove(page)
+
+  def integrate(self, container):
+    "Process the integral contents of a container as it is written."
+    page = self.current
+    elements = container.searchall(Container) + [container]
+    if self.fulltoc:
+      self.converttoc(elements)
+    for element in elements:
+      if isinstance(element, BiblioEntry):
+        self.bibliography.processeach(element)
+      elif isinstance(element, BiblioCite):
+        if element.key in self.bibliography.entries:
+          self.bibliography.processcite(element)
+      elif isinstance(element, Reference):
+        page.references.append(element)
+      elif isinstance(element, Float):
+        self.floats.processeach(element)
+      elif isinstance(element, TableOfContents):
+        self.toc.store(element)
+        page.waiting = True
+        self.fulltoc = True
+      elif isinstance(element, ListOf):
+        self.listof.store(element)
+        page.waiting = True
+
+  def converttoc(self, elements):
+    "Add all part keys among the given elements to the TOC tree, in the"
+    "order they were created, as the full TOC does with all pages in memory."
+    self.unconverted.update(PartKeyGenerator.partkeyed[self.partkeyed:])
+    self.partkeyed = len(PartKeyGenerator.partkeyed)
+    converter = TOCConverter()
+    for element in elements:
+      if element in self.unconverted:
+        converter.convert(element)
+        self.unconverted.remove(element)
+
+  def setpages(self, page):
+    "Set the page for all links written to a page since the last call;"
+    "keep those that point somewhere, to wait until their target is written."
+    name = os.path.basename(page.page)
+    for container in page.contents[page.linked:]:
+      links = container.searchall(Link)
+      if isinstance(container, Link):
+        links.append(container)
+      for link in links:
+        link.page = name
+        if link.destination:
+          page.links.append(link)
+    page.linked = len(page.contents)
+
 class SplitTOCBasket(SplitPartBasket):
   "A basket which contains the TOC for a split part document."
 
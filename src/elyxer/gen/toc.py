@@ -32,6 +32,8 @@ from elyxer.util.docparams import *
 class TOCEntry(Container):
   "A container for a TOC entry."
 
+  html = None
+
   def __init__(self):
     Container.__init__(self)
     self.branches = []
@@ -84,6 +86,12 @@ class TOCEntry(Container):
       return False
     return True
 
+  def gethtml(self):
+    "Get the HTML code only once: links point to the same URL on every page."
+    if not self.html:
+      self.html = Container.gethtml(self)
+    return list(self.html)
+
   def __unicode__(self):
     "Return a printable representation."
     if not self.partkey.tocentry:
@@ -135,15 +143,40 @@ class IndentedEntry(Container):
     "Return a printable documentation."
     return 'Indented ' + unicode(self.entry)
 
+class TOCFragment(Container):
+  "A list of TOC entries shared by several insets."
+  "The HTML code is computed only once and reused for every inset."
+
+  html = None
+
+  def __init__(self):
+    Container.__init__(self)
+    self.output = ContentsOutput()
+
+  def gethtml(self):
+    "Get the HTML code only once."
+    if not self.html:
+      self.html = Container.gethtml(self)
+    return list(self.html)
+
+  def __unicode__(self):
+    "Return a printable representation."
+    return 'TOC fragment with ' + unicode(len(self.contents)) + ' entries'
+
 class TOCTree(object):
   "A tree that contains the full TOC."
+  "Entries are also kept in document order, so that all entries below"
+  "a given one are a slice of the list."
 
   def __init__(self):
     self.tree = []
     self.branches = []
+    self.entries = []
 
   def store(self, entry):
     "Place the entry in a tree of entries."
+    entry.index = len(self.entries)
+    self.entries.append(entry)
     while len(self.tree) < entry.partkey.level:
       self.tree.append(None)
     if len(self.tree) > entry.partkey.level:
@@ -163,6 +196,21 @@ class TOCTree(object):
         return element
     return None
 
+  def getbranches(self, entry):
+    "Get all entries below the given one (its sub-tree) in document order."
+    return self.entries[entry.index + 1:self.findend(entry)]
+
+  def isclosed(self, entry):
+    "Find out if no more entries can be added below the given one."
+    return self.findend(entry) < len(self.entries)
+
+  def findend(self, entry):
+    "Find the position after the last entry below the given one."
+    end = entry.index + 1
+    while end < len(self.entries) and self.entries[end].partkey.level > entry.partkey.level:
+      end += 1
+    return end
+
 class TOCConverter(object):
   "A converter from elyxer.containers to TOC entries."
 
@@ -194,6 +242,7 @@ class TOCConverter(object):
       return None
     entry = TOCEntry().create(container)
     TOCConverter.cache[container.partkey.partkey] = entry
-    TOCConverter.tree.store(entry)
+    if not container.partkey.header:
+      TOCConverter.tree.store(entry)
     return entry
 
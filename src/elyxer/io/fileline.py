@@ -38,6 +38,8 @@ class LineReader(object):
     self.linenumber = 1
     self.lastline = None
     self.current = None
+    self.tokens = None
+    self.recording = None
     self.mustread = True
     self.depleted = False
     try:
@@ -64,12 +66,32 @@ class LineReader(object):
       self.readline()
     return self.current
 
+  def currenttokens(self):
+    "Get the current line split into tokens, only once per line."
+    if self.mustread:
+      self.readline()
+    if not self.tokens:
+      self.tokens = LineTokens(self.current)
+    return self.tokens
+
   def nextline(self):
     "Go to next line"
     if self.depleted:
       Trace.fatal('Read beyond file end')
+    if self.recording != None and not self.mustread:
+      self.recording.append(self.current)
     self.mustread = True
 
+  def startrecording(self):
+    "Start recording all lines passed, until stopped."
+    self.recording = []
+
+  def stoprecording(self):
+    "Stop recording and return all lines passed since started."
+    recorded = self.recording
+    self.recording = None
+    return recorded
+
   def readline(self):
     "Read a line from elyxer.file"
     self.current = self.file.readline()
@@ -78,6 +100,7 @@ class LineReader(object):
     if len(self.current) == 0:
       self.depleted = True
     self.current = self.current.rstrip('\n\r')
+    self.tokens = None
     self.linenumber += 1
     self.mustread = False
     Trace.prefix = 'Line ' + unicode(self.linenumber) + ': '
@@ -95,6 +118,21 @@ class LineReader(object):
   def close(self):
     self.file.close()
 
+class LineTokens(object):
+  "A line read from a file, split into tokens once and shared by all parsers."
+
+  def __init__(self, raw):
+    self.raw = raw
+    self.stripped = raw.strip()
+    self.tokens = self.stripped.split()
+    self.first = None
+    if len(self.tokens) > 0:
+      self.first = self.tokens[0]
+
+  def __unicode__(self):
+    "Return a printable representation."
+    return 'Line tokens ' + unicode(self.tokens)
+
 class LineWriter(object):
   "Writes a file as a series of lists"
 
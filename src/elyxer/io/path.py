@@ -44,6 +44,20 @@ class Path(object):
     "Return last modification time"
     return os.path.getmtime(self.path)
 
+  def replacefile(cls, temporary, filename):
+    "Replace a file with a temporary file, keeping the old file until the"
+    "new one is in place. Where a file cannot be renamed over another"
+    "(Windows) the old file is moved aside first and then removed."
+    if os.name != 'nt' or not os.path.exists(filename):
+      os.rename(temporary, filename)
+      return
+    backup = filename + '.bak'
+    if os.path.exists(backup):
+      os.remove(backup)
+    os.rename(filename, backup)
+    os.rename(temporary, filename)
+    os.remove(backup)
+
   def hasexts(self, exts):
     "Check if the file has one of the given extensions."
     for ext in exts:
@@ -70,15 +84,21 @@ class Path(object):
       return False
     return self.path == path.path
 
+  replacefile = classmethod(replacefile)
+
 class InputPath(Path):
   "Represents an input file"
 
+  dependencies = set()
+
   def __init__(self, url):
-    "Create the input path based on url"
+    "Create the input path based on url; keep it as a dependency with --watch."
     self.url = url
     self.path = url
     if not os.path.isabs(url):
       self.path = os.path.join(Options.directory, url)
+    if Options.watch:
+      InputPath.dependencies.add(self.path)
 
 class OutputPath(Path):
   "Represents an output file"
@@ -97,6 +117,13 @@ class OutputPath(Path):
     base, oldext = os.path.splitext(self.url)
     self.url = base + ext
 
+  def addsuffix(self, suffix):
+    "Add a suffix to the name of the file, before the extension"
+    base, ext = os.path.splitext(self.path)
+    self.path = base + suffix + ext
+    base, ext = os.path.splitext(self.url)
+    self.url = base + suffix + ext
+
   def exists(self):
     "Check if the file exists"
     return os.path.exists(self.path)
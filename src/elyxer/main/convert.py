@@ -24,16 +24,23 @@
 # http://www.nongnu.org/elyxer/
 
 
+import os
 import os.path
+import sys
+import time
+import subprocess
+import traceback
 from elyxer.io.fileline import *
 from elyxer.util.options import *
 from elyxer.gen.factory import *
 from elyxer.gen.toc import *
 from elyxer.gen.inset import *
+from elyxer.gen.image import *
 from elyxer.gen.basket import *
 from elyxer.gen.integral import *
 from elyxer.gen.splitpart import *
 from elyxer.proc.process import *
+from elyxer.proc.incremental import *
 from elyxer.maths.postformula import *
 
 
@@ -42,12 +49,15 @@ class eLyXerConverter(object):
 
   def __init__(self):
     self.filtering = False
+    self.cache = None
 
   def setio(self, ioparser):
     "Set the InOutParser"
     self.reader = ioparser.getreader()
     self.basket = self.getbasket()
     self.basket.setwriter(ioparser.getwriter())
+    self.cache = self.getcache(ioparser)
+    ImageFile.index = self.getimageindex(ioparser)
     return self
 
   def getbasket(self):
@@ -57,11 +67,37 @@ class eLyXerConverter(object):
         return SplitTOCBasket()
       return TOCBasket()
     if Options.splitpart:
+      if Options.lowmem:
+        return SplitStreamBasket()
       return SplitPartBasket()
     if Options.memory:
       return MemoryBasket()
     return WriterBasket()
 
+  def getcache(self, ioparser):
+    "Get the incremental cache for the output file, if requested."
+    "With --splitpart the pages are kept in a manifest instead."
+    if not Options.incremental:
+      return None
+    if not isinstance(ioparser.fileout, basestring):
+      Trace.error('Option --incremental needs an output file')
+      return None
+    if Options.tocfor:
+      Trace.error('Option --incremental does not work with --tocfor')
+      return None
+    if Options.splitpart:
+      return None
+    return IncrementalCache(ioparser.fileout + '.cache')
+
+  def getimageindex(self, ioparser):
+    "Get the persistent index of image dimensions, if requested."
+    if not Options.imageindex:
+      return None
+    if not isinstance(ioparser.fileout, basestring):
+      Trace.error('Option --imageindex needs an output file')
+      return None
+    return ImageIndex(ioparser.fileout + '.images')
+
   def embed(self, reader):
     "Embed the results from elyxer.a reader into a memory basket."
     "Header and footer are ignored. Useful for embedding one document inside another."
@@ -86,14 +122,29 @@ class eLyXerConverter(object):
     "Parse the contents and write it by containers"
     factory = ContainerFactory()
     processor = Processor(self.filtering)
+    processor.cache = self.cache
     while not self.reader.finished():
-      container = factory.createcontainer(self.reader)
+      container = self.createcontainer(factory)
       result = processor.process(container)
       self.writecontainer(result)
     result = processor.postprocess(None)
     self.writecontainer(result)
     if not self.filtering:
       self.basket.finish()
+    ImageConverter.instance.finish()
+    if ImageFile.index:
+      ImageFile.index.save()
+    if self.cache:
+      self.cache.save()
+
+  def createcontainer(self, factory):
+    "Create a top-level container, with its source for the incremental cache."
+    if not self.cache:
+      return factory.createcontainer(self.reader)
+    self.reader.startrecording()
+    container = factory.createcontainer(self.reader)
+    self.cache.setsource(container, self.reader.stoprecording())
+    return container
 
   def writecontainer(self, container):
     "Write each container to the correct basket."
@@ -182,11 +233,116 @@ class ConverterFactory(object):
       reader.setend(int(container.lstparams['lastline']))
     return eLyXerConverter().embed(reader)
 
+class DocumentWatcher(object):
+  "Watch a document and all files it depends on, converting it on any change."
+  "Each conversion runs in a forked process, so that the parent process keeps"
+  "the configuration and the parse tree loaded, but no state from the"
+  "previous conversion leaks into the next one."
+
+  interval = 0.5
+
+  def __init__(self, commandline, args):
+    "Keep the original command line, and the input and output files."
+    self.commandline = commandline
+    self.args = args
+    self.mtimes = dict()
+
+  def watch(self):
+    "Convert the document, then wait for changes and convert again."
+    if len(self.args) < 2:
+      Trace.error('Option --watch needs an input and an output file')
+      return
+    # compile the parse tree once, before forking
+    ContainerFactory()
+    self.convert()
+    Trace.message('Watching ' + unicode(len(self.mtimes)) + ' files, press Ctrl+C to stop')
+    try:
+      while True:
+        time.sleep(self.interval)
+        if self.getmtimes() != self.mtimes:
+          self.settle()
+          self.convert()
+    except KeyboardInterrupt:
+      Trace.message('Stopped watching')
+
+  def settle(self):
+    "Wait until files stop changing, to convert once after a burst of writes."
+    mtimes = self.getmtimes()
+    time.sleep(self.interval)
+    while self.getmtimes() != mtimes:
+      mtimes = self.getmtimes()
+      time.sleep(self.interval)
+
+  def convert(self):
+    "Convert the document and keep the list of files it depends on."
+    start = time.time()
+    dependencies = self.convertforked()
+    dependencies += [self.args[0], Options.template] + Options.embedcss
+    self.mtimes = dict()
+    for filename in dependencies:
+      if filename:
+        self.mtimes[filename] = None
+    self.mtimes = self.getmtimes()
+    Trace.message('Converted ' + self.args[0] + ' in ' + '%.2f' % (time.time() - start) + ' s')
+
+  def convertforked(self):
+    "Convert the document in a child process; return the files it read."
+    if not hasattr(os, 'fork'):
+      # no fork (e.g. on Windows): run a new process, without the watch
+      commandline = [x for x in self.commandline if x != '--watch']
+      subprocess.call([sys.executable] + commandline)
+      return []
+    read, write = os.pipe()
+    Trace.flush()
+    pid = os.fork()
+    if pid == 0:
+      status = 1
+      try:
+        os.close(read)
+        try:
+          self.convertdocument()
+          status = 0
+        finally:
+          dependencies = '\n'.join(sorted(InputPath.dependencies))
+          os.write(write, dependencies.encode('utf-8'))
+          os.close(write)
+      except:
+        traceback.print_exc()
+      Trace.flush()
+      os._exit(status)
+    os.close(write)
+    pipe = os.fdopen(read, 'rb')
+    dependencies = pipe.read().decode('utf-8')
+    pipe.close()
+    os.waitpid(pid, 0)
+    if dependencies == '':
+      return []
+    return dependencies.split('\n')
+
+  def convertdocument(self):
+    "Convert the document once."
+    ioparser = InOutParser().parse(list(self.args))
+    converter = eLyXerConverter().setio(ioparser)
+    converter.convert()
+
+  def getmtimes(self):
+    "Get the modification times for all watched files; None if missing."
+    mtimes = dict()
+    for filename in self.mtimes:
+      mtimes[filename] = None
+      if os.path.exists(filename):
+        mtimes[filename] = os.path.getmtime(filename)
+    return mtimes
+
 IncludeInset.converterfactory = ConverterFactory()
 
 def convertdoc(args):
   "Read a whole document from the command line and write it."
+  commandline = list(args)
   Options().parseoptions(args)
+  if Options.watch:
+    DocumentWatcher(commandline, args).watch()
+    return
   ioparser = InOutParser().parse(args)
   converter = eLyXerConverter().setio(ioparser)
   converter.convert()
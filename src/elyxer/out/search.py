@@ -0,0 +1,230 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   eLyXer -- convert LyX source files to HTML output.
+#
+#   Copyright (C) 2009 Alex Fernández
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# --end--
+# Alex 20261019
+# eLyXer search index for split output.
+
+import os
+import re
+import codecs
+import tempfile
+from elyxer.util.trace import Trace
+from elyxer.out.template import *
+
+
+class SearchIndex(object):
+  "An inverted index of the words in each part of the output, for searching."
+  "Each part is a page and an anchor with its TOC entry. The index is built"
+  "as pages are written: words are kept in memory up to a budget, then"
+  "sorted and spilled to a temporary file; all spills are merged at the end"
+  "into a single JavaScript file with a small search function."
+  "The budget is an approximate size in bytes, estimated from the length"
+  "of each word plus a fixed overhead per word and per posting."
+
+  budget = 16000000
+  wordsize = 100
+  postingsize = 40
+  escapes = {u'"':u'\\"', u'\\':u'\\\\', u'\n':u'\\n', u'\r':u'\\r', u'\t':u'\\t'}
+  wordsplitter = re.compile(r'\w+', re.UNICODE)
+  loader = [
+      u'var elyxerSearch = {\n',
+      u'  words: function(text) {\n',
+      u'    var words = text.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || [];\n',
+      u'    return words.filter(function(word) { return word.length > 1; });\n',
+      u'  },\n',
+      u'  find: function(word) {\n',
+      u'    var deltas = this.index.words[word] || [], parts = [], part = 0;\n',
+      u'    for (var i = 0; i < deltas.length; i++) parts.push(part += deltas[i]);\n',
+      u'    return parts;\n',
+      u'  },\n',
+      u'  search: function(text) {\n',
+      u'    var words = this.words(text), found = null;\n',
+      u'    for (var i = 0; i < words.length; i++) {\n',
+      u'      var parts = this.find(words[i]);\n',
+      u'      found = found ? found.filter(function(part) { return parts.indexOf(part) >= 0; }) : parts;\n',
+      u'    }\n',
+      u'    var parts = this.index.parts;\n',
+      u'    return (found || []).map(function(part) { return {url: parts[part][0], title: parts[part][1]}; });\n',
+      u'  }\n',
+      u'};\n',
+      ]
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.postings = dict()
+    self.size = 0
+    self.spills = []
+    self.parts = tempfile.TemporaryFile()
+    self.partcount = 0
+    self.current = set()
+    try:
+      import json
+      self.json = json
+    except ImportError:
+      # Python 2.4 and 2.5: quote strings by hand
+      self.json = None
+
+  def add(self, container, page):
+    "Add the words in a top-level container written to the given page."
+    if container.partkey and container.partkey.header:
+      return
+    if container.partkey and container.partkey.tocentry:
+      url = os.path.basename(page) + '#' + container.partkey.partkey
+      self.startpart(url, self.gettitle(container.partkey))
+    elif self.partcount == 0:
+      self.startpart(os.path.basename(page), DocumentTitle().getvalue())
+    for word in self.wordsplitter.findall(container.extracttext().lower()):
+      if len(word) > 1 and not word in self.current:
+        self.current.add(word)
+        self.size += 2 * len(word) + self.wordsize
+    if self.size > self.budget:
+      self.storepart()
+
+  def gettitle(self, partkey):
+    "Get the title of a part from its part key."
+    if not partkey.titlecontents:
+      return partkey.tocentry
+    title = ''
+    for container in partkey.titlecontents:
+      title += container.extracttext()
+    return partkey.tocentry + ': ' + title
+
+  def startpart(self, url, title):
+    "Start a new part, storing the words of the previous one."
+    self.storepart()
+    line = u'[' + self.quote(url) + u', ' + self.quote(title) + u']\n'
+    self.parts.write(line.encode('utf-8'))
+    self.partcount += 1
+
+  def storepart(self):
+    "Store the postings for the words in the current part."
+    "A long part may be stored in several goes, so a part is added only once."
+    part = self.partcount - 1
+    for word in self.current:
+      if not word in self.postings:
+        self.postings[word] = []
+      elif self.postings[word][-1] == part:
+        continue
+      self.postings[word].append(part)
+      self.size += self.postingsize
+    self.current = set()
+    if self.size > self.budget:
+      self.spill()
+
+  def spill(self):
+    "Write the postings sorted by word to a temporary file, and clear them."
+    spill = tempfile.TemporaryFile()
+    for word in sorted(self.postings.keys()):
+      parts = ','.join([unicode(part) for part in self.postings[word]])
+      spill.write((word + u'\t' + parts + u'\n').encode('utf-8'))
+    spill.seek(0)
+    self.spills.append(spill)
+    self.postings = dict()
+    self.size = 0
+
+  def readspill(self, index, spill):
+    "Read the postings in a temporary file as (word, spill index, parts)."
+    for line in spill:
+      word, parts = line.decode('utf-8').rstrip('\n').split('\t')
+      yield (word, index, [int(part) for part in parts.split(',')])
+
+  def merge(self):
+    "Merge all spills, yielding each word with all its parts in order."
+    readers = [self.readspill(index, spill) for index, spill in enumerate(self.spills)]
+    try:
+      from heapq import merge
+    except ImportError:
+      # Python 2.4 and 2.5
+      merge = self.mergeruns
+    word = None
+    parts = []
+    for nextword, index, nextparts in merge(*readers):
+      if nextword != word:
+        if word:
+          yield word, parts
+        word = nextword
+        parts = []
+      for part in nextparts:
+        if len(parts) == 0 or parts[-1] != part:
+          parts.append(part)
+    if word:
+      yield word, parts
+
+  def mergeruns(self, *readers):
+    "Merge several sorted runs, for Pythons without heapq.merge."
+    import heapq
+    heap = []
+    for reader in readers:
+      for item in reader:
+        heap.append((item, reader))
+        break
+    heapq.heapify(heap)
+    while heap:
+      item, reader = heapq.heappop(heap)
+      yield item
+      for item in reader:
+        heapq.heappush(heap, (item, reader))
+        break
+
+  def quote(self, text):
+    "Quote a string for JavaScript."
+    if self.json:
+      quoted = self.json.dumps(text, ensure_ascii=False)
+    else:
+      quoted = u'"'
+      for char in text:
+        if char in self.escapes:
+          quoted += self.escapes[char]
+        elif ord(char) < 32:
+          quoted += u'\\u%04x' % ord(char)
+        else:
+          quoted += char
+      quoted += u'"'
+    # valid in JSON but not in JavaScript strings
+    return quoted.replace(u'\u2028', u'\\u2028').replace(u'\u2029', u'\\u2029')
+
+  def finish(self):
+    "Merge everything and write the index file."
+    self.storepart()
+    self.spill()
+    file = codecs.open(self.filename, 'w', 'utf-8')
+    file.writelines(self.loader)
+    file.write(u'elyxerSearch.index = {"parts": [\n')
+    self.parts.seek(0)
+    separator = u''
+    for line in self.parts:
+      file.write(separator + line.decode('utf-8').rstrip('\n'))
+      separator = u',\n'
+    file.write(u'],\n"words": {\n')
+    separator = u''
+    for word, parts in self.merge():
+      deltas = [parts[0]] + [parts[i] - parts[i - 1] for i in range(1, len(parts))]
+      deltas = u','.join([unicode(delta) for delta in deltas])
+      file.write(separator + self.quote(word) + u':[' + deltas + u']')
+      separator = u',\n'
+    file.write(u'}};\n')
+    file.close()
+    for spill in self.spills:
+      spill.close()
+    self.parts.close()
+    Trace.message('Search index: ' + unicode(self.partcount) + ' parts in '
+        + self.filename)
+
@@ -22,6 +22,8 @@
 # Alex 20100620
 # eLyXer HTML templates
 
+import os
+import re
 import datetime
 from elyxer.io.bulk import *
 from elyxer.parse.position import *
@@ -36,26 +38,24 @@ class HTMLTemplate(object):
   "A template for HTML generation."
 
   current = None
+  compiledheader = None
+  compiledfooter = None
 
   def getheader(self):
     "Get the header (before content) of the template."
     return []
 
   def convertheader(self):
-    "Convert the header and all variables."
-    return self.convert(self.getheader())
+    "Convert the header and all variables; the header is compiled once."
+    if not self.compiledheader:
+      self.compiledheader = CompiledTemplate().compile(self.getheader())
+    return self.compiledheader.render(VariableMap())
 
   def convertfooter(self):
-    "Convert the footer and all variables."
-    return self.convert(self.getfooter())
-
-  def convert(self, html):
-    "Convert a bit of HTML replacing all variables."
-    varmap = VariableMap()
-    for index, line in enumerate(html):
-      if '<!--$' in line:
-        html[index] = varmap.replace(line)
-    return html
+    "Convert the footer and all variables; the footer is compiled once."
+    if not self.compiledfooter:
+      self.compiledfooter = CompiledTemplate().compile(self.getfooter())
+    return self.compiledfooter.render(VariableMap())
 
   def getfooter(self):
     "Get the footer (after content) of the template."
@@ -89,8 +89,23 @@ class FileTemplate(HTMLTemplate):
   "A template read from elyxer.a file."
 
   divider = '<!--$content-->'
+  compiled = dict()
 
   def read(self):
+    "Read and compile the template, unless it was compiled before"
+    "with the same modification time."
+    key = Options.template
+    if os.path.exists(Options.template):
+      key = (Options.template, os.path.getmtime(Options.template))
+    if not key in FileTemplate.compiled:
+      self.split()
+      header = CompiledTemplate().compile(self.header)
+      footer = CompiledTemplate().compile(self.footer)
+      FileTemplate.compiled[key] = (header, footer)
+    self.compiledheader, self.compiledfooter = FileTemplate.compiled[key]
+    return self
+
+  def split(self):
     "Read the file, separate header and footer."
     self.header = []
     lines = []
@@ -105,7 +120,6 @@ class FileTemplate(HTMLTemplate):
       self.header = lines
       lines = []
     self.footer = lines
-    return self
 
   def templatelines(self):
     "Read all lines in the template, separate content into its own line."
@@ -120,14 +134,6 @@ class FileTemplate(HTMLTemplate):
           yield FileTemplate.divider
         yield split[-1]
 
-  def getheader(self):
-    "Return the header (before content)."
-    return self.header
-
-  def getfooter(self):
-    "Return the footer (after the content)."
-    return self.footer
-
 class DefaultTemplate(HTMLTemplate):
   "The default HTML template when not configured."
 
@@ -225,8 +231,47 @@ class DefaultTemplate(HTMLTemplate):
     html.append('</div>\n')
     return html
 
+class CompiledTemplate(object):
+  "A template compiled into literal chunks and variable slots."
+  "Lines without variables are kept as they are; the rest are split into"
+  "pieces with literal text at even positions and variable names at odd."
+
+  variable = re.compile(r'<!--\$([^\W\d_]*)-->', re.UNICODE)
+
+  def compile(self, html):
+    "Compile a list of lines."
+    self.lines = []
+    for line in html:
+      if not '<!--$' in line:
+        self.lines.append(line)
+        continue
+      pieces = self.variable.split(line)
+      for literal in pieces[::2]:
+        if '<!--$' in literal:
+          Trace.error('Weird template format in ' + line)
+      self.lines.append(pieces)
+    return self
+
+  def render(self, varmap):
+    "Render all lines using the values in a variable map."
+    html = []
+    for line in self.lines:
+      if isinstance(line, basestring):
+        html.append(line)
+        continue
+      pieces = list(line)
+      for index in range(1, len(pieces), 2):
+        pieces[index] = varmap.getvalue(pieces[index])
+      html.append(u''.join(pieces))
+    return html
+
 class VariableMap(object):
   "A map with all replacement variables."
+  "Volatile variables change on every run; they can be deferred, left as"
+  "they are in the template and replaced later."
+
+  volatile = ['year', 'date', 'datetime']
+  deferred = False
 
   def __init__(self):
     self.variables = dict()
@@ -247,28 +292,20 @@ class VariableMap(object):
     if Options.mathjax:
       self.variables['mathjax'] = Options.mathjax
 
-  def replace(self, line):
-    "Replace all variables in a line."
-    result = ''
-    pos = TextPosition(line)
-    while not pos.finished():
-      if pos.checkskip('<!--$'):
-        result += self.getvalue(pos)
-      else:
-        result += pos.skipcurrent()
-    return result
-
-  def getvalue(self, pos):
-    "Get the value of the variable at the given position."
-    value = ''
-    key = pos.globalpha()
+  def getvalue(self, key):
+    "Get the value of the variable with the given name."
+    if VariableMap.deferred and key in VariableMap.volatile:
+      return '<!--$' + key + '-->'
     if not key in self.variables:
       Trace.error('Template variable ' + key + ' not found')
-    else:
-      value = self.variables[key]
-    if not pos.checkskip('-->'):
-      Trace.error('Weird template format in ' + line)
-    return value
+      return ''
+    return self.variables[key]
+
+  def replacevolatile(self, line):
+    "Replace only the volatile variables in a line, once deferred."
+    for key in VariableMap.volatile:
+      line = line.replace('<!--$' + key + '-->', self.variables[key])
+    return line
 
 class DocumentTitle(object):
   "The title of the whole document."
@@ -56,7 +56,7 @@ class HeaderParser(Parser):
 
   def parsebranch(self, reader):
     "Parse all branch definitions."
-    branch = reader.currentline().split()[1]
+    branch = reader.currenttokens().tokens[1]
     reader.nextline()
     subparser = HeaderParser().complete(HeaderConfig.parameters['endbranch'])
     subparser.parse(reader)
@@ -36,34 +36,35 @@ class Parser(object):
 
   def parseheader(self, reader):
     "Parse the header"
-    header = reader.currentline().split()
+    header = reader.currenttokens().tokens
     reader.nextline()
     self.begin = reader.linenumber
     return header
 
   def parseparameter(self, reader):
     "Parse a parameter"
-    if reader.currentline().strip().startswith('<'):
+    line = reader.currenttokens()
+    if line.stripped.startswith('<'):
       key, value = self.parsexml(reader)
       self.parameters[key] = value
       return
-    split = reader.currentline().strip().split(' ', 1)
     reader.nextline()
-    if len(split) == 0:
+    if not line.first:
       return
-    key = split[0]
-    if len(split) == 1:
+    key = line.first
+    if len(line.tokens) == 1:
       self.parameters[key] = True
       return
-    if not '"' in split[1]:
-      self.parameters[key] = split[1].strip()
+    value = line.stripped[len(key):]
+    if not '"' in value:
+      self.parameters[key] = value.strip()
       return
-    doublesplit = split[1].split('"')
+    doublesplit = value.split('"')
     self.parameters[key] = doublesplit[1]
 
   def parsexml(self, reader):
     "Parse a parameter in xml form: <param attr1=value...>"
-    strip = reader.currentline().strip()
+    strip = reader.currenttokens().stripped
     reader.nextline()
     if not strip.endswith('>'):
       Trace.error('XML parameter ' + strip + ' should be <...>')
@@ -94,6 +95,21 @@ class Parser(object):
     while not reader.currentline().startswith(self.ending):
       process()
 
+  def skipnested(self, reader, start):
+    "Skip all lines up to the current ending, including the final line."
+    "Nested containers with the same start and ending are skipped whole."
+    depth = 0
+    while not reader.finished():
+      line = reader.currenttokens()
+      reader.nextline()
+      if line.raw.startswith(self.ending):
+        if depth == 0:
+          return
+        depth -= 1
+      elif line.first == start:
+        depth += 1
+    Trace.error('No ending ' + unicode(self.ending) + ' for ' + unicode(self))
+
   def parsecontainer(self, reader, contents):
     container = self.factory.createcontainer(reader)
     if container:
@@ -135,12 +151,12 @@ class TextParser(Parser):
 
   def isending(self, reader):
     "Check if text is ending"
-    current = reader.currentline().split()
-    if len(current) == 0:
+    first = reader.currenttokens().first
+    if not first:
       return False
-    if current[0] in self.endings:
-      if current[0] in TextParser.stack:
-        TextParser.stack.remove(current[0])
+    if first in self.endings:
+      if first in TextParser.stack:
+        TextParser.stack.remove(first)
       else:
         TextParser.stack = []
       return True
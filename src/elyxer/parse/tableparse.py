@@ -44,8 +44,9 @@ class TableParser(BoundedParser):
 
   def startswithheader(self, reader):
     "Check if the current line starts with a header line"
+    stripped = reader.currenttokens().stripped
     for start in TableParser.headers:
-      if reader.currentline().strip().startswith(start):
+      if stripped.startswith(start):
         return True
     return False
 
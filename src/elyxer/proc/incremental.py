@@ -0,0 +1,267 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   eLyXer -- convert LyX source files to HTML output.
+#
+#   Copyright (C) 2009 Alex Fernández
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# --end--
+# Alex 20261019
+# eLyXer incremental conversion: reuse the HTML for unchanged paragraphs.
+
+import os
+import pickle
+from elyxer.util.trace import Trace
+from elyxer.util.digest import *
+from elyxer.util.options import *
+from elyxer.util.numbering import *
+from elyxer.util.docparams import *
+from elyxer.gen.container import *
+from elyxer.gen.layout import *
+from elyxer.gen.notes import *
+from elyxer.maths.formula import *
+from elyxer.maths.macro import *
+from elyxer.ref.label import *
+
+
+class CachedHTML(Container):
+  "The HTML for the contents of a container, taken from the incremental cache."
+
+  def __init__(self):
+    self.contents = []
+    self.output = FixedOutput()
+
+  def create(self, html):
+    "Create the container with the cached HTML."
+    self.html = html
+    if len(html) == 0:
+      self.output = EmptyOutput()
+    return self
+
+  def __unicode__(self):
+    "Return a printable representation."
+    return 'Cached HTML (' + unicode(len(self.html)) + ' lines)'
+
+class IncrementalCache(object):
+  "A cache of the HTML for top-level paragraphs, stored next to the output."
+  "Each paragraph is keyed by a hash of its source lines and of the state"
+  "it depends on: counters, macros and document parameters. On a hit the"
+  "paragraph is not processed; the cached HTML is used and the counters"
+  "are advanced as the original processing did."
+
+  cacheable = ['StandardLayout']
+  allowed = [
+      'StringContainer', 'Constant', 'BlackBox', 'StandardLayout', 'PlainLayout',
+      'EmphaticText', 'BoldText', 'ShapedText', 'SizeText', 'ColorText',
+      'TextFamily', 'VersalitasText', 'BarredText', 'StrikeOut', 'LangLine',
+      'Newline', 'NewlineInset', 'Hfill', 'Space', 'QuoteContainer',
+      'URL', 'FlexURL', 'FlexInset', 'SideNote', 'Footnote', 'Note',
+      'InsetText', 'PhantomText', 'Formula',
+      ]
+
+  def __init__(self, filename):
+    "Set the cache file; it is read on first use."
+    self.filename = filename
+    self.entries = None
+    self.stored = dict()
+    self.hits = 0
+    self.misses = 0
+
+  def setsource(self, container, lines):
+    "Set the hash of the source lines for a top-level container."
+    if not container or not self.iscacheable(container):
+      return
+    digest = md5()
+    for line in lines:
+      digest.update(line.encode('utf-8') + '\n')
+    container.sourcehash = digest.hexdigest()
+
+  def process(self, container, processor):
+    "Process a top-level container using the cache if possible."
+    "Returns False if the container was not handled by the cache."
+    if not hasattr(container, 'sourcehash'):
+      return False
+    key = self.getkey(container)
+    entries = self.getentries()
+    if key in entries:
+      html, counters = entries[key]
+      self.restore(container, html, counters)
+      self.stored[key] = entries[key]
+      self.hits += 1
+      return True
+    self.misses += 1
+    self.processfully(container, processor, key)
+    return True
+
+  def processfully(self, container, processor, key):
+    "Process and postprocess a container right away, and cache the result."
+    labels = len(Label.names)
+    references = len(Reference.references)
+    macros = self.getmacros()
+    processor.processcontainer(container)
+    processor.postprocessor.postrecursive(container)
+    container.postprocess = False
+    if labels != len(Label.names) or references != len(Reference.references):
+      return
+    if macros != self.getmacros():
+      return
+    html = ContentsOutput().gethtml(container)
+    self.stored[key] = (html, self.getcounters())
+
+  def restore(self, container, html, counters):
+    "Restore a container from the cache, and advance counters."
+    self.setcounters(counters)
+    container.process()
+    container.contents = [CachedHTML().create(html)]
+    container.postprocess = False
+
+  def iscacheable(self, container):
+    "Find out if a top-level container can be cached."
+    if not container.__class__.__name__ in self.cacheable:
+      return False
+    return self.isallowed(container)
+
+  def isallowed(self, container):
+    "Find out if a container and all its contents have no side effects."
+    "Side effects on counters are allowed: counters are restored."
+    if not container.__class__.__name__ in self.allowed:
+      return False
+    if isinstance(container, Formula) and not self.isformulaallowed(container):
+      return False
+    if isinstance(container, Footnote) and Options.endfoot:
+      return False
+    for element in container.contents:
+      if not self.isallowed(element):
+        return False
+    return True
+
+  def isformulaallowed(self, formula):
+    "Find out if a formula does not define labels or macros."
+    if formula.header[0] == 'numbered':
+      return False
+    if not isinstance(formula.parsed, basestring):
+      return True
+    for command in FormulaConfig.labelfunctions:
+      if command in formula.parsed:
+        return False
+    for command in FormulaConfig.misccommands:
+      if FormulaConfig.misccommands[command] == 'MacroDefinition':
+        if command in formula.parsed:
+          return False
+    return True
+
+  def getkey(self, container):
+    "Get the key for a container: source plus dependent state."
+    state = (self.getcounters(), self.getmacros(), self.getparameters())
+    digest = md5(container.sourcehash)
+    digest.update(repr(state))
+    return digest.hexdigest()
+
+  def getcounters(self):
+    "Get the current state of all counters, sorted by name."
+    counters = []
+    for name in sorted(NumberGenerator.counters.keys()):
+      counter = NumberGenerator.counters[name]
+      master = None
+      last = None
+      if counter.master:
+        master = counter.master.name
+        last = counter.last
+      counters.append((name, counter.value, counter.mode, master, last))
+    return counters
+
+  def setcounters(self, counters):
+    "Set all counters to the given state, creating them if necessary."
+    masters = dict()
+    for name, value, mode, master, last in counters:
+      masters[name] = master
+    for name, value, mode, master, last in counters:
+      counter = self.getcounter(name, masters)
+      counter.value = value
+      counter.mode = mode
+      if master:
+        counter.last = last
+
+  def getcounter(self, name, masters):
+    "Get a counter by name, creating it (and its master) if necessary."
+    if name in NumberGenerator.counters:
+      return NumberGenerator.counters[name]
+    if masters[name]:
+      master = self.getcounter(masters[name], masters)
+      counter = DependentCounter(name).setmaster(master)
+    else:
+      counter = NumberCounter(name)
+    NumberGenerator.counters[name] = counter
+    return counter
+
+  def getmacros(self):
+    "Get the current definitions of all macros."
+    macros = []
+    for name in sorted(MacroDefinition.macros.keys()):
+      macros.append((name, MacroDefinition.macros[name].original))
+    return macros
+
+  def getparameters(self):
+    "Get the current document parameters."
+    parameters = []
+    for name in sorted(vars(DocumentParameters).keys()):
+      if not name.startswith('_'):
+        parameters.append((name, getattr(DocumentParameters, name)))
+    return parameters
+
+  def getsignature(self):
+    "Get a signature for the eLyXer version and the runtime options."
+    "A cache created with a different signature is discarded."
+    options = []
+    for name in sorted(vars(Options).keys()):
+      value = getattr(Options, name)
+      if name.startswith('_') or callable(value) or name == 'branches':
+        continue
+      options.append((name, value))
+    branches = []
+    for name in sorted(Options.branches.keys()):
+      branches.append((name, Options.branches[name].isselected()))
+    version = GeneralConfig.version['number'] + ' ' + GeneralConfig.version['date']
+    return repr((version, options, branches))
+
+  def getentries(self):
+    "Get the entries in the cache file, reading it the first time."
+    if self.entries != None:
+      return self.entries
+    self.entries = dict()
+    if not os.path.exists(self.filename):
+      return self.entries
+    try:
+      file = open(self.filename, 'rb')
+      signature, entries = pickle.load(file)
+      file.close()
+    except Exception:
+      Trace.error('Invalid incremental cache ' + self.filename + ', ignoring')
+      return self.entries
+    if signature != self.getsignature():
+      Trace.message('Options or version changed, discarding incremental cache')
+      return self.entries
+    self.entries = entries
+    return self.entries
+
+  def save(self):
+    "Save the entries used in this conversion to the cache file."
+    Trace.message('Incremental conversion: ' + unicode(self.hits)
+        + ' paragraphs reused, ' + unicode(self.misses) + ' converted')
+    file = open(self.filename, 'wb')
+    pickle.dump((self.getsignature(), self.stored), file, 2)
+    file.close()
+
@@ -41,13 +41,15 @@ class Processor(object):
     "With filtering on, the classes in skipfiltered are not processed at all."
     self.filtering = filtering
     self.postprocessor = Postprocessor()
+    self.cache = None
 
   def process(self, container):
     "Do the whole processing on a container."
     if self.filtering and container.__class__.__name__ in self.skipfiltered:
       return None
     container = self.preprocess(container)
-    self.processcontainer(container)
+    if not self.cache or not self.cache.process(container, self):
+      self.processcontainer(container)
     if not container:
       # do not postprocess empty containers from elyxer.here
       return container
@@ -22,6 +22,7 @@
 # Alex 20100713
 # eLyXer: indexing entries
 
+import unicodedata
 from elyxer.util.trace import Trace
 from elyxer.util.translate import *
 from elyxer.parse.parser import *
@@ -47,7 +48,13 @@ class ListInset(Container):
     keys.sort()
     return keys
 
+  def collate(cls, text):
+    "Get a key to sort a text ignoring case and accents."
+    decomposed = unicodedata.normalize('NFKD', unicode(text).lower())
+    return u''.join([char for char in decomposed if not unicodedata.combining(char)])
+
   sortdictionary = classmethod(sortdictionary)
+  collate = classmethod(collate)
 
 class ListOf(ListInset):
   "A list of entities (figures, tables, algorithms)"
@@ -133,27 +140,24 @@ class IndexGroup(Container):
 
   def create(self):
     "Create an index group."
-    self.entries = dict()
     self.output = EmptyOutput()
+    self.entries = []
     return self
 
-  def findentry(self, names):
-    "Find the entry with the given names."
+  def add(self, entry):
+    "Add an entry to the group."
     if self == IndexGroup.root:
       self.output = ContentsOutput()
     else:
       self.output = TaggedOutput().settag('div class="indexgroup"', True)
-    lastname = names[-1]
-    if not lastname in self.entries:
-      self.entries[lastname] = IndexEntry().create(names)
-    return self.entries[lastname]
+    self.entries.append(entry)
 
   def sort(self):
-    "Sort all entries in the group."
-    for key in ListInset.sortdictionary(self.entries):
-      entry = self.entries[key]
+    "Sort the entries in the group by their sort keys, and then each subgroup."
+    self.entries.sort(key = lambda entry: entry.sortkey)
+    self.contents = list(self.entries)
+    for entry in self.entries:
       entry.group.sort()
-      self.contents.append(entry)
 
   def __unicode__(self):
     "Return a printable representation."
@@ -166,13 +170,19 @@ class IndexEntry(Container):
   "When an index entry is of the form 'part1 ! part2 ...', "
   "a hierarchical structure in the form of an IndexGroup is constructed."
   "An index entry contains a mandatory header, and an optional group."
+  "All entries are kept in a dictionary by their full path."
+  "The sort key ignores case and accents, and then uses the name to break ties."
+
+  entries = dict()
 
   def create(self, names):
-    "Create an index entry with the given name."
+    "Create an index entry with the given names."
     self.output = ContentsOutput()
     self.header = IndexHeader().create(names)
     self.group = IndexGroup().create()
     self.contents = [self.header, self.group]
+    lastname = names[-1]
+    self.sortkey = (ListInset.collate(lastname), lastname)
     return self
 
   def addref(self, reference):
@@ -181,13 +191,20 @@ class IndexEntry(Container):
 
   def get(cls, name):
     "Get the index entry for the given name."
-    group = IndexGroup.root
-    parts = IndexEntry.splitname(name)
-    readparts = []
-    for part in parts:
-      readparts.append(part)
-      entry = group.findentry(readparts)
-      group = entry.group
+    return cls.find(cls.splitname(name))
+
+  def find(cls, names):
+    "Find the index entry for the given names, creating it if necessary."
+    path = u'!'.join(names)
+    if path in cls.entries:
+      return cls.entries[path]
+    if len(names) == 1:
+      supergroup = IndexGroup.root
+    else:
+      supergroup = cls.find(names[:-1]).group
+    entry = IndexEntry().create(names)
+    supergroup.add(entry)
+    cls.entries[path] = entry
     return entry
 
   def splitname(cls, name):
@@ -199,6 +216,7 @@ class IndexEntry(Container):
     return 'Index entry for ' + self.header.name
 
   get = classmethod(get)
+  find = classmethod(find)
   splitname = classmethod(splitname)
 
 class PrintIndex(ListInset):
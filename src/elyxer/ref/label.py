@@ -40,6 +40,7 @@ class Label(Link):
   def __init__(self):
     Link.__init__(self)
     self.lastnumbered = None
+    self.numberedparent = None
 
   def process(self):
     "Process a label container."
@@ -59,8 +60,13 @@ class Label(Link):
 
   def findpartkey(self):
     "Get the part key for the latest numbered container seen."
+    "A numbered parent is kept once found: its part key does not change."
+    if self.numberedparent:
+      return self.numberedparent.partkey
     numbered = self.numbered(self)
     if numbered and numbered.partkey:
+      if numbered != self.lastnumbered:
+        self.numberedparent = numbered
       return numbered.partkey
     return ''
 
@@ -84,6 +90,7 @@ class Reference(Link):
   "A reference to a label."
 
   references = dict()
+  templates = dict()
   key = 'none'
 
   def process(self):
@@ -103,17 +110,7 @@ class Reference(Link):
 
   def formatcontents(self):
     "Format the reference contents."
-    formatkey = self.getparameter('LatexCommand')
-    if not formatkey:
-      formatkey = 'ref'
-    self.formatted = u'↕'
-    if formatkey in StyleConfig.referenceformats:
-      self.formatted = StyleConfig.referenceformats[formatkey]
-    else:
-      Trace.error('Unknown reference format ' + formatkey)
-    self.replace(u'↕', self.direction)
-    self.replace('#', '1')
-    self.replace('on-page', Translator.translate('on-page'))
+    self.formatted = self.gettemplate()
     partkey = self.destination.findpartkey()
     # only if partkey and partkey.number are not null, send partkey.number
     self.replace('@', partkey and partkey.number)
@@ -128,6 +125,25 @@ class Reference(Link):
       self.contents += partkey.titlecontents
       self.contents.append(Constant(piece))
 
+  def gettemplate(self):
+    "Get the format template with all keys that do not depend on the label"
+    "replaced; it is computed only once for each format and direction."
+    formatkey = self.getparameter('LatexCommand')
+    if not formatkey:
+      formatkey = 'ref'
+    if (formatkey, self.direction) in Reference.templates:
+      return Reference.templates[(formatkey, self.direction)]
+    self.formatted = u'↕'
+    if formatkey in StyleConfig.referenceformats:
+      self.formatted = StyleConfig.referenceformats[formatkey]
+    else:
+      Trace.error('Unknown reference format ' + formatkey)
+    self.replace(u'↕', self.direction)
+    self.replace('#', '1')
+    self.replace('on-page', Translator.translate('on-page'))
+    Reference.templates[(formatkey, self.direction)] = self.formatted
+    return self.formatted
+
   def replace(self, key, value):
     "Replace a key in the format template with a value."
     if not key in self.formatted:
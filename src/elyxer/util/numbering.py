@@ -138,12 +138,31 @@ class DependentCounter(NumberCounter):
     "Get the value of the combined counter: master.dependent."
     return self.master.getvalue() + '.' + NumberCounter.getvalue(self)
 
+class LayoutNumbering(object):
+  "The numbering attributes for a layout type: level and kind of numbering."
+
+  def __init__(self, type):
+    self.type = type
+    self.unordered = '*' in type
+    self.roman = False
+    self.ordered = False
+    self.level = 0
+    self.numbered = False
+    self.parttype = type
+    self.master = None
+
+  def __unicode__(self):
+    "Return a printable representation."
+    return 'Numbering for ' + self.type + ' at level ' + unicode(self.level)
+
 class NumberGenerator(object):
   "A number generator for unique sequences and hierarchical structures. Used in:"
   "  * ordered part numbers: Chapter 3, Section 5.3."
   "  * unique part numbers: Footnote 15, Bibliography cite [15]."
   "  * chaptered part numbers: Figure 3.15, Equation (8.3)."
   "  * unique roman part numbers: Part I, Book IV."
+  "The numbering for each layout type is computed once, and again only"
+  "when the starting level, the maximum depth or the appendix change."
 
   chaptered = None
   generator = None
@@ -153,56 +172,76 @@ class NumberGenerator(object):
 
   counters = dict()
   appendix = None
+  numberings = dict()
+  numberingstate = None
 
   def deasterisk(self, type):
     "Remove the possible asterisk in a layout type."
     return type.replace('*', '')
 
+  def getnumbering(self, type):
+    "Get the numbering attributes for a layout type."
+    state = (DocumentParameters.startinglevel, DocumentParameters.maxdepth, NumberGenerator.appendix)
+    if state != NumberGenerator.numberingstate:
+      NumberGenerator.numberings = dict()
+      NumberGenerator.numberingstate = state
+    if not type in NumberGenerator.numberings:
+      NumberGenerator.numberings[type] = self.createnumbering(type)
+    return NumberGenerator.numberings[type]
+
+  def createnumbering(self, type):
+    "Create the numbering attributes for a layout type."
+    numbering = LayoutNumbering(type)
+    name = self.deasterisk(type).lower()
+    numbering.roman = name in self.romanlayouts
+    numbering.ordered = name in self.orderedlayouts
+    numbering.parttype = self.deasterisk(type)
+    if numbering.roman:
+      numbering.numbered = True
+    elif numbering.ordered:
+      index = self.orderedlayouts.index(name)
+      numbering.level = index + 1 - DocumentParameters.startinglevel
+      if numbering.level <= DocumentParameters.maxdepth:
+        numbering.numbered = not numbering.unordered
+      if numbering.level > 1:
+        numbering.master = self.orderedlayouts[index - 1]
+    if numbering.unordered:
+      numbering.numbered = False
+    if NumberGenerator.appendix and numbering.level == 1:
+      numbering.parttype = 'Appendix'
+    return numbering
+
   def isunique(self, type):
     "Find out if the layout type corresponds to a unique part."
-    return self.isroman(type)
+    return self.getnumbering(type).roman
 
   def isroman(self, type):
     "Find out if the layout type should have roman numeration."
-    return self.deasterisk(type).lower() in self.romanlayouts
+    return self.getnumbering(type).roman
 
   def isinordered(self, type):
     "Find out if the layout type corresponds to an (un)ordered part."
-    return self.deasterisk(type).lower() in self.orderedlayouts
+    return self.getnumbering(type).ordered
 
   def isnumbered(self, type):
     "Find out if the type for a layout corresponds to a numbered layout."
-    if '*' in type:
-      return False
-    if self.isroman(type):
-      return True
-    if not self.isinordered(type):
-      return False
-    if self.getlevel(type) > DocumentParameters.maxdepth:
-      return False
-    return True
+    return self.getnumbering(type).numbered
 
   def isunordered(self, type):
     "Find out if the type contains an asterisk, basically."
-    return '*' in type
+    return self.getnumbering(type).unordered
 
   def getlevel(self, type):
     "Get the level that corresponds to a layout type."
-    if self.isunique(type):
-      return 0
-    if not self.isinordered(type):
+    numbering = self.getnumbering(type)
+    if not numbering.roman and not numbering.ordered:
       Trace.error('Unknown layout type ' + type)
-      return 0
-    type = self.deasterisk(type).lower()
-    level = self.orderedlayouts.index(type) + 1
-    return level - DocumentParameters.startinglevel
+    return numbering.level
 
   def getparttype(self, type):
     "Obtain the type for the part: without the asterisk, "
     "and switched to Appendix if necessary."
-    if NumberGenerator.appendix and self.getlevel(type) == 1:
-      return 'Appendix'
-    return self.deasterisk(type)
+    return self.getnumbering(type).parttype
 
   def generate(self, type):
     "Generate a number for a layout type."
@@ -221,10 +260,9 @@ class NumberGenerator(object):
 
   def create(self, type):
     "Create a counter for the given type."
-    if self.isnumbered(type) and self.getlevel(type) > 1:
-      index = self.orderedlayouts.index(type)
-      above = self.orderedlayouts[index - 1]
-      master = self.getcounter(above)
+    numbering = self.getnumbering(type)
+    if numbering.numbered and numbering.master:
+      master = self.getcounter(numbering.master)
       return self.createdependent(type, master)
     counter = NumberCounter(type)
     if self.isroman(type):
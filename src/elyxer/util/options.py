@@ -58,10 +58,19 @@ class Options(object):
   lyxformat = False
   target = None
   splitpart = None
+  searchindex = False
   memory = True
   lowmem = False
   nobib = False
   converter = 'imagemagick'
+  jobs = 1
+  imagecache = None
+  batchconvert = False
+  imageindex = False
+  srcset = None
+  inlineimagesunder = None
+  bibcache = None
+  sortbib = False
   raw = False
   jsmath = None
   mathjax = None
@@ -83,6 +92,8 @@ class Options(object):
   copyimages = False
   googlecharts = False
   embedcss = []
+  incremental = False
+  watch = False
 
   branches = dict()
 
@@ -118,6 +129,26 @@ class Options(object):
       except:
         Trace.error('--splitpart needs a numeric argument, not ' + Options.splitpart)
         self.usage()
+    if Options.searchindex and not Options.splitpart:
+      Trace.error('--searchindex requires --splitpart')
+      self.usage()
+    if Options.jobs != 1:
+      try:
+        Options.jobs = int(Options.jobs)
+        if Options.jobs <= 0:
+          Trace.error('--jobs requires a number bigger than zero')
+          self.usage()
+      except:
+        Trace.error('--jobs needs a numeric argument, not ' + unicode(Options.jobs))
+        self.usage()
+    self.parsesrcset()
+    if Options.inlineimagesunder:
+      try:
+        Options.inlineimagesunder = int(Options.inlineimagesunder)
+      except ValueError:
+        Trace.error('--inlineimagesunder needs a size in bytes, not '
+            + Options.inlineimagesunder)
+        self.usage()
     if Options.lowmem or Options.toc or Options.tocfor:
       Options.memory = False
     self.parsefootnotes()
@@ -167,6 +198,19 @@ class Options(object):
     if not Options.numberfoot and not Options.symbolfoot:
       Options.letterfoot = True
 
+  def parsesrcset(self):
+    "Parse the widths for the scaled variants of images."
+    if not Options.srcset:
+      return
+    widths = []
+    for width in Options.srcset.split(','):
+      try:
+        widths.append(int(width))
+      except ValueError:
+        Trace.error('--srcset needs a list of widths in pixels, not ' + Options.srcset)
+        self.usage()
+    Options.srcset = sorted(widths)
+
   def showoptions(self):
     "Show all possible options"
     Trace.error('  Common options:')
@@ -192,6 +236,12 @@ class Options(object):
     Trace.error('    --imageformat ".ext":   image output format, or "copy" to copy images')
     Trace.error('    --noconvert:            do not convert images, use in original locations')
     Trace.error('    --converter "inkscape": use an alternative program to convert images')
+    Trace.error('    --jobs "N":             run N jobs at a time: images, BibTeX files, split pages')
+    Trace.error('    --imagecache "dir":     keep converted images in a shared cache directory')
+    Trace.error('    --batchconvert:         convert images with the same parameters in one call')
+    Trace.error('    --imageindex:           keep image sizes and paths in an index next to the output')
+    Trace.error('    --srcset "480,960":     add scaled variants of images, loaded lazily')
+    Trace.error('    --inlineimagesunder "N": embed images smaller than N bytes in the page')
     Trace.error('  Options for footnote display:')
     Trace.error('    --numberfoot:           mark footnotes with numbers instead of letters')
     Trace.error('    --symbolfoot:           mark footnotes with symbols (*, **...)')
@@ -205,6 +255,7 @@ class Options(object):
     Trace.error('        "sup", "align"')
     Trace.error('  Advanced output options:')
     Trace.error('    --splitpart "depth":    split the resulting webpage at the given depth')
+    Trace.error('    --searchindex:          write an uncompressed search index for the split pages')
     Trace.error('    --tocfor "page":        generate a TOC that points to the given page')
     Trace.error('    --target "frame":       make all links point to the given frame')
     Trace.error('    --notoclabels:          omit the part labels in the TOC, such as Chapter')
@@ -215,6 +266,10 @@ class Options(object):
     Trace.error('    --googlecharts:         use Google Charts to generate formula images')
     Trace.error('    --template "file":      use a template, put everything in <!--$content-->')
     Trace.error('    --copyright:            add a copyright notice at the bottom')
+    Trace.error('    --incremental:          reuse unchanged paragraphs, or write only changed split pages')
+    Trace.error('    --watch:                convert again whenever the input files change')
+    Trace.error('    --bibcache "dir":       keep parsed BibTeX files in a cache directory')
+    Trace.error('    --sortbib:              sort the bibliography by author, year and title')
     Trace.error('  Deprecated options:')
     Trace.error('    --toc:                  (deprecated) create a table of contents')
     Trace.error('    --toctarget "page":     (deprecated) generate a TOC for the given page')
@@ -65,9 +65,19 @@ class Trace(object):
       message = message.encode('utf-8')
     channel.write(message + '\n')
 
+  def flush(cls):
+    "Flush standard output and error: before a fork, so that buffered text"
+    "is not written twice; in a child, since os._exit() does not flush."
+    for channel in [sys.stdout, sys.stderr]:
+      try:
+        channel.flush()
+      except IOError:
+        pass
+
   debug = classmethod(debug)
   message = classmethod(message)
   error = classmethod(error)
   fatal = classmethod(fatal)
   show = classmethod(show)
+  flush = classmethod(flush)
 
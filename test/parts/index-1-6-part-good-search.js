@@ -0,0 +1,257 @@
+var elyxerSearch = {
+  words: function(text) {
+    var words = text.toLowerCase().match(/[\p{L}\p{N}_]+/gu) || [];
+    return words.filter(function(word) { return word.length > 1; });
+  },
+  find: function(word) {
+    var deltas = this.index.words[word] || [], parts = [], part = 0;
+    for (var i = 0; i < deltas.length; i++) parts.push(part += deltas[i]);
+    return parts;
+  },
+  search: function(text) {
+    var words = this.words(text), found = null;
+    for (var i = 0; i < words.length; i++) {
+      var parts = this.find(words[i]);
+      found = found ? found.filter(function(part) { return parts.indexOf(part) >= 0; }) : parts;
+    }
+    var parts = this.index.parts;
+    return (found || []).map(function(part) { return {url: parts[part][0], title: parts[part][1]}; });
+  }
+};
+elyxerSearch.index = {"parts": [
+["index-1-6-part-test.html", "Index Test"],
+["index-1-6-part-test-Part-I.html#toc-Part-I", "Part I: The Making"],
+["index-1-6-part-test-1.html#toc-Chapter-1", "Chapter 1: Explanations"],
+["index-1-6-part-test-1.html#toc-Section-1.1", "Section 1.1: Magical type face changes in the world"],
+["index-1-6-part-test-1.html#toc-Section-1.2", "Section 1.2: Colorand colour"],
+["index-1-6-part-test-1.html#toc-Section--1", "Section: Unnumbered Section"],
+["index-1-6-part-test-2.html#toc-Chapter-2", "Chapter 2: Nomenclature"],
+["index-1-6-part-test-2.html#toc-Section-2.1", "Section 2.1: Reminder"],
+["index-1-6-part-test-2.html#toc-Section-2.2", "Section 2.2: Remainder"],
+["index-1-6-part-test-Part-II.html#toc-Part-II", "Part II: The Additions"],
+["index-1-6-part-test-3.html#toc-Chapter-3", "Chapter 3: Bulk, or what used to be bulk text"],
+["index-1-6-part-test-Part--I.html#toc-Part--I", "Part: Unnumbered Part"],
+["index-1-6-part-test-Chapter--1.html#toc-Chapter--1", "Chapter: Unnumbered Chapter"],
+["index-1-6-part-test-Part-III.html#toc-Part-III", "Part III: Our Definition"],
+["index-1-6-part-test-4.html#toc-Chapter-4", "Chapter 4: The definition"],
+["index-1-6-part-test-4.html#toc-Section-4.1", "Section 4.1: But I Already Knew That"],
+["index-1-6-part-test-4.html#toc-Subsection-4.1.1", "Subsection 4.1.1: I Want My Money Back"],
+["index-1-6-part-test-4.html#toc-Subsubsection-4.1.1.1", "Subsubsection 4.1.1.1: Completely Unfair Dude"],
+["index-1-6-part-test-4.html#toc-Paragraph-1", "Paragraph: A Paragraph For You"],
+["index-1-6-part-test-4.html#toc-Section--2", "Section: Unordered Section"],
+["index-1-6-part-test-4.html#toc-Paragraph-2", "Paragraph: But There Is More"],
+["index-1-6-part-test-A.html#toc-Appendix-A", "Appendix A: Appendix"],
+["index-1-6-part-test-Index.html#Index", "Index"],
+["index-1-6-part-test-Nomenclature.html#Nomenclature", "Nomenclature"],
+["index-1-6-part-test-Bibliography.html#Bibliography", "Bibliography"]],
+"words": {
+"01":[24],
+"1999":[24],
+"24":[24],
+"able":[2],
+"activity":[23],
+"actual":[12],
+"actually":[2,4,4],
+"add":[2],
+"added":[3,1],
+"additions":[9],
+"already":[15],
+"also":[2],
+"although":[2],
+"an":[6,13,2,2],
+"anchors":[10],
+"and":[6,4,2,7,1,3],
+"any":[2],
+"appendix":[21],
+"are":[10],
+"as":[2],
+"at":[3,1],
+"back":[16],
+"bad":[10],
+"be":[2,1,1,1,2,1,2],
+"because":[2,3],
+"been":[2],
+"beginning":[5],
+"better":[2],
+"bulk":[10],
+"but":[2,2,2,4,5,5],
+"call":[17],
+"can":[3,3,4],
+"changes":[3],
+"chapter":[2,3,7],
+"cites":[2],
+"clear":[2],
+"colorand":[4],
+"colour":[4],
+"common":[23],
+"completely":[17],
+"contains":[2,10],
+"contents":[0,12,2],
+"corrupts":[5],
+"could":[2,2],
+"couple":[12],
+"december":[24],
+"definition":[13,1],
+"destination":[23],
+"didn":[17],
+"do":[2,4],
+"does":[23],
+"down":[2],
+"dude":[17],
+"else":[20],
+"elyxer":[23],
+"embed":[19],
+"errors":[10],
+"everything":[2],
+"except":[12],
+"explain":[6],
+"explained":[8],
+"explanation":[23],
+"explanations":[2],
+"extra":[12],
+"face":[3],
+"fake":[19],
+"figures":[12],
+"file":[6],
+"files":[23],
+"find":[10],
+"first":[19],
+"for":[2,8,2,6],
+"generate":[6],
+"hand":[10],
+"happens":[6],
+"has":[2],
+"have":[5,2,3,6],
+"here":[5,3,9,2,2],
+"hey":[17],
+"hide":[10],
+"however":[4],
+"html":[24],
+"if":[6,4,9],
+"in":[2,1,7,9],
+"index":[0,2,4,4,12,1],
+"inside":[10],
+"interest":[12],
+"is":[2,4,4,4,6],
+"it":[2,3,5,9],
+"item":[19],
+"just":[2,8,9],
+"knew":[15],
+"know":[6],
+"later":[2,4],
+"least":[3],
+"like":[10,13],
+"links":[10],
+"list":[5,7,7,4],
+"little":[3],
+"live":[5],
+"look":[2],
+"lot":[2,8],
+"lucky":[15],
+"magical":[3],
+"making":[1],
+"might":[2,8],
+"mix":[6],
+"money":[16],
+"more":[3,1,6,10],
+"much":[10],
+"my":[16],
+"need":[10],
+"needed":[10],
+"next":[5],
+"nice":[2,3],
+"no":[2],
+"nomenclature":[6,17],
+"nomenclaturegenerate":[23],
+"normally":[6],
+"not":[2,8],
+"nothing":[12,8],
+"now":[2,17],
+"occur":[23],
+"of":[0,2,8,2,2,9],
+"on":[2,8],
+"one":[2,10],
+"order":[10],
+"ordered":[19],
+"other":[4,6],
+"otherwise":[10],
+"our":[10,3],
+"out":[10],
+"page":[10],
+"paragraph":[18],
+"part":[11,1],
+"parts":[12],
+"point":[3,1],
+"problem":[2],
+"reader":[7],
+"reading":[10],
+"reference":[23],
+"remainder":[8],
+"remains":[8],
+"remembered":[7],
+"remind":[7],
+"reminder":[7],
+"repeated":[2],
+"requires":[23],
+"right":[2,3],
+"section":[5,14],
+"see":[2,17],
+"should":[6,2],
+"show":[19],
+"since":[10],
+"so":[10],
+"someone":[2],
+"something":[23],
+"sooner":[2],
+"source":[23],
+"specification":[24],
+"subsection":[19],
+"table":[0,12,2],
+"take":[10],
+"terms":[2,4,4,13],
+"test":[0],
+"text":[10],
+"than":[2],
+"thanks":[10],
+"that":[2,4,1,3,5,4,4],
+"the":[1,1,1,2,1,1,2,1,4],
+"them":[2],
+"there":[16,4,1],
+"they":[5,5,13],
+"things":[7],
+"this":[2,1,1,8],
+"thrice":[2],
+"to":[2,3,1,1,3,9,4],
+"toc":[14,5],
+"too":[5,5],
+"top":[10],
+"totally":[18],
+"twice":[2],
+"two":[2],
+"type":[3],
+"uncalled":[18],
+"unfair":[17],
+"unnumbered":[5,6,1],
+"unordered":[19],
+"up":[2],
+"us":[10],
+"w3c":[24],
+"want":[2,4,10],
+"we":[2,4,1,3,9],
+"were":[15],
+"what":[6],
+"whatever":[8],
+"when":[6],
+"where":[23],
+"which":[2],
+"will":[2,4,1,12],
+"with":[6,17],
+"won":[4],
+"words":[23],
+"working":[10],
+"works":[19],
+"world":[3],
+"would":[5,5],
+"yes":[10],
+"you":[2,13,1,1,1],
+"your":[16,3]}};